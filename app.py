@@ -1,13 +1,16 @@
 import io
 import os
+import tempfile
+from collections import deque
 
 import pandas as pd
 import streamlit as st
 
 from pathlib import Path
 
-from morphotag.clean import process_dir_to_folders, pretty_summarize_reports
-from morphotag.diagnose import diagnose_with_api_pretty, pretty_print_diagnosis
+from morphotag.clean import iter_process_dir, CLEAN_DIR_NAME, REVIEW_DIR_NAME
+from morphotag.reports import JsonlReportSink, SummaryCounter, feed_sinks, pretty_report_text
+from morphotag.diagnose import DiagnosisPool, pretty_print_diagnosis
 from morphotag.parser import build_df_from_dir_without_pylangacq
 
 st.set_page_config(page_title="ba2kit UI", page_icon="🗂️", layout="wide")
@@ -18,6 +21,37 @@ def list_cha_files(folder: Path):
         return []
     return sorted(folder.rglob("*.cha"))
 
+@st.cache_resource
+def _diagnosis_holder() -> dict:
+    return {"jobs": None, "pool": None}
+
+def diagnosis_pool(jobs: int) -> DiagnosisPool:
+    # Se conserva entre clics: los procesos ya tienen batchalign importado. Uno solo:
+    # al cambiar jobs se cierra el anterior (como DiagnoseTab en app_qt)
+    holder = _diagnosis_holder()
+    if holder["pool"] is None or holder["jobs"] != jobs:
+        if holder["pool"] is not None: holder["pool"].close()
+        holder["jobs"], holder["pool"] = jobs, DiagnosisPool(jobs)
+    return holder["pool"]
+
+REPORT_TAIL = 20
+
+class StreamlitReportSink:
+    # Un solo elemento que se reescribe con los contadores y los últimos informes: la
+    # página no crece con el corpus (el informe completo va al JSONL)
+    def __init__(self, placeholder, counter: SummaryCounter, tail: int = REPORT_TAIL):
+        self.placeholder = placeholder; self.counter = counter
+        self.recent = deque(maxlen=tail)
+
+    def add(self, rep: dict):
+        self.recent.append(pretty_report_text(rep))
+        with self.placeholder.container():
+            st.caption(self.counter.text())
+            st.code("\n".join(self.recent))
+
+    def close(self):
+        pass
+
 def text_download(name: str, text: str, label="Descargar"):
     st.download_button(label, data=text.encode("utf-8"), file_name=name, mime="text/plain")
 
@@ -66,39 +100,52 @@ with tabs[0]:
             st.error("Indica una carpeta.")
         else:
             with st.status("Procesando…", expanded=True) as status:
-                reports, clean_dir, review_dir = process_dir_to_folders(
+                st.write("✅ Limpios/arreglados →", str(Path(input_dir) / CLEAN_DIR_NAME))
+                st.write("🧪 Necesitan revisión →", str(Path(input_dir) / REVIEW_DIR_NAME))
+                st.subheader("Resumen de cambios")
+                counter = SummaryCounter()
+                fd, report_path = tempfile.mkstemp(prefix="morphotag-clean-", suffix=".jsonl"); os.close(fd)
+                st.session_state["clean_report_jsonl"] = report_path
+                # cada informe se cuenta, se guarda y se muestra en cuanto su archivo está listo
+                feed_sinks(iter_process_dir(
                     input_dir,
                     rename_on_change=rename,
                     backup=True,
                     missing_hdr_policy=missing_policy,
                     empty_hdr_policy=empty_policy,
-                )
-                st.write("✅ Limpios/arreglados →", clean_dir)
-                st.write("🧪 Necesitan revisión →", review_dir)
-                summary = pretty_summarize_reports(reports)
-                st.subheader("Resumen de cambios")
-                st.code(summary)
+                ), [counter, JsonlReportSink(report_path), StreamlitReportSink(st.empty(), counter)])
                 status.update(label="Hecho", state="complete")
 
+    report_path = st.session_state.get("clean_report_jsonl")
+    if report_path and Path(report_path).exists():
+        with open(report_path, "rb") as f:
+            st.download_button("Descargar informe completo (JSONL)", f, file_name="clean_report.jsonl",
+                               mime="application/jsonl")
+
 # ---------- 2) diagnosticar ----------
 with tabs[1]:
     st.header("Diagnóstico legible (API batchalign)")
     diag_path = st.text_input("Archivo .cha o carpeta", value=str(base) if base else "")
     before = st.number_input("Contexto: líneas antes", min_value=0, max_value=20, value=3, step=1)
     after  = st.number_input("Contexto: líneas después", min_value=0, max_value=20, value=3, step=1)
+    jobs = st.number_input("Procesos en paralelo", min_value=1, max_value=os.cpu_count() or 1, value=1, step=1)
+    lint = st.checkbox("Pre-chequeo rápido (batchalign sólo si lo pasa)", value=True)
+    diag_cache = st.checkbox("Reutilizar diagnósticos de archivos sin cambios (caché)", value=True)
     if st.button("Diagnosticar", use_container_width=True):
         p = Path(diag_path)
         files = [p] if p.is_file() else list_cha_files(p)
         if not files:
             st.warning("No se encontraron .cha.")
         else:
-            for f in files:
-                diag = diagnose_with_api_pretty(str(f), before=before, after=after)
+            for f, diag in zip(files, diagnosis_pool(int(jobs)).imap(files, before=before, after=after, lint=lint,
+                                                                                  cache=diag_cache)):
                 st.subheader(f.name)
                 if diag.get("ok"):
                     st.success("Sin errores al parsear (API).")
                     continue
                 st.error(f"{diag.get('error_type','Error')}: {diag.get('message','')}")
+                if diag.get("lint"):
+                    st.text("\n".join(f"L{x['line']}: {x['message']}" for x in diag["lint"]))
                 meta = []
                 if diag.get("cha_line") is not None:
                     meta.append(f"Línea estimada: {diag['cha_line']}")
@@ -118,12 +165,13 @@ with tabs[2]:
     st.header("CSV de tokens y avisos (sin pylangacq)")
     csv_dir = st.text_input("Carpeta con .cha", value=str(base) if base else "")
     recursive = st.checkbox("Buscar recursivamente", value=False)
+    use_cache = st.checkbox("Reutilizar análisis de archivos sin cambios (caché)", value=True)
     if st.button("Generar CSVs", use_container_width=True):
         if not csv_dir:
             st.error("Indica una carpeta.")
         else:
             with st.status("Construyendo DataFrames…", expanded=True) as status:
-                df, df_issues = build_df_from_dir_without_pylangacq(Path(csv_dir), recursive=recursive)
+                df, df_issues = build_df_from_dir_without_pylangacq(Path(csv_dir), recursive=recursive, cache=use_cache)
                 st.write("Tokens:", df.shape, " · Issues:", df_issues.shape)
                 st.dataframe(df.head(50))
                 df_download_button(df, "tokens.csv", "Descargar tokens.csv")
@@ -7,9 +7,10 @@ from PySide6.QtWidgets import (
 )
 from PySide6.QtCore import Qt
 
-from ba2kit.clean import process_dir_to_folders, pretty_summarize_reports
-from ba2kit.diagnose import diagnose_with_api_pretty
-from ba2kit.parser_light import build_df_from_dir_without_pylangacq
+from morphotag.clean import iter_process_dir, CLEAN_DIR_NAME, REVIEW_DIR_NAME
+from morphotag.diagnose import DiagnosisPool
+from morphotag.parser import build_df_from_dir_without_pylangacq
+from morphotag.reports import SummaryCounter, pretty_report_text
 
 class CleanTab(QWidget):
     def __init__(self, parent=None):
@@ -57,17 +58,21 @@ class CleanTab(QWidget):
             self.log("❌ Indica una carpeta.")
             return
         try:
-            reports, clean_dir, review_dir = process_dir_to_folders(
+            self.log(f"✅ Limpios/arreglados → {Path(folder) / CLEAN_DIR_NAME}")
+            self.log(f"🧪 Necesitan revisión → {Path(folder) / REVIEW_DIR_NAME}")
+            self.log("\nResumen de cambios:\n")
+            counter = SummaryCounter()
+            for rep in iter_process_dir(
                 folder,
                 rename_on_change=self.rename.isChecked(),
                 backup=True,
                 missing_hdr_policy=self.missing.currentText(),
                 empty_hdr_policy=self.empty.currentText(),
-            )
-            self.log(f"✅ Limpios/arreglados → {clean_dir}")
-            self.log(f"🧪 Necesitan revisión → {review_dir}")
-            self.log("\nResumen de cambios:\n")
-            self.out.append(f"<pre>{pretty_summarize_reports(reports)}</pre>")
+            ):
+                counter.add(rep)
+                self.out.append(f"<pre>{pretty_report_text(rep)}</pre>")
+                QApplication.processEvents()
+            self.log(counter.text())
         except Exception as e:
             self.log("❌ Error:\n" + traceback.format_exc())
 
@@ -89,7 +94,15 @@ class DiagnoseTab(QWidget):
         self.after  = QSpinBox(); self.after.setRange(0, 20);  self.after.setValue(3)
         row2.addWidget(QLabel("Contexto antes:")); row2.addWidget(self.before)
         row2.addWidget(QLabel("después:")); row2.addWidget(self.after)
+        self.jobs = QSpinBox(); self.jobs.setRange(1, os.cpu_count() or 1); self.jobs.setValue(1)
+        row2.addWidget(QLabel("Procesos:")); row2.addWidget(self.jobs)
+        self.lint = QCheckBox("Pre-chequeo rápido"); self.lint.setChecked(True)
+        row2.addWidget(self.lint)
+        self.use_cache = QCheckBox("Usar caché"); self.use_cache.setChecked(True)
+        row2.addWidget(self.use_cache)
         lay.addLayout(row2)
+        # Se conserva entre diagnósticos (batchalign ya importado en cada proceso)
+        self._pool = None
 
         self.btn = QPushButton("Diagnosticar")
         self.btn.clicked.connect(self.run)
@@ -119,13 +132,19 @@ class DiagnoseTab(QWidget):
         if not files:
             self.log("⚠️ No se encontraron .cha.")
             return
-        for f in files:
-            d = diagnose_with_api_pretty(str(f), before=self.before.value(), after=self.after.value())
+        if self._pool is None or self._pool.workers != self.jobs.value():
+            if self._pool is not None: self._pool.close()
+            self._pool = DiagnosisPool(self.jobs.value())
+        for f, d in zip(files, self._pool.imap(files, before=self.before.value(), after=self.after.value(),
+                                                         lint=self.lint.isChecked(),
+                                                         cache=self.use_cache.isChecked())):
             self.out.append(f"<b>{f.name}</b>")
+            QApplication.processEvents()
             if d.get("ok"):
                 self.log("✅ Sin errores al parsear (API).")
                 continue
             self.log(f"❌ {d.get('error_type','Error')}: {d.get('message','')}")
+            if d.get("lint"): self.out.append("<pre>" + "\n".join(f"L{x['line']}: {x['message']}" for x in d["lint"]) + "</pre>")
             meta = []
             if d.get("cha_line") is not None: meta.append(f"Línea estimada: {d['cha_line']}")
             if d.get("py_line")  is not None: meta.append(f"(traceback) última 'line N': {d['py_line']}")
@@ -150,9 +169,11 @@ class CsvTab(QWidget):
 
         row2 = QHBoxLayout()
         self.recursive = QCheckBox("Recursivo"); self.recursive.setChecked(False)
+        self.use_cache = QCheckBox("Usar caché"); self.use_cache.setChecked(True)
         self.out_tokens = QLineEdit("tokens.csv")
         self.out_issues = QLineEdit("issues.csv")
         row2.addWidget(self.recursive)
+        row2.addWidget(self.use_cache)
         row2.addWidget(QLabel("CSV tokens:")); row2.addWidget(self.out_tokens)
         row2.addWidget(QLabel("CSV issues:")); row2.addWidget(self.out_issues)
         lay.addLayout(row2)
@@ -171,13 +192,13 @@ class CsvTab(QWidget):
     def log(self, txt): self.out.append(txt)
 
     def run(self):
-        from ba2kit.parser_light import build_df_from_dir_without_pylangacq
         folder = self.dir_edit.text().strip()
         if not folder:
             self.log("❌ Indica carpeta.")
             return
         try:
-            df, issues = build_df_from_dir_without_pylangacq(Path(folder), recursive=self.recursive.isChecked())
+            df, issues = build_df_from_dir_without_pylangacq(Path(folder), recursive=self.recursive.isChecked(),
+                                                              cache=self.use_cache.isChecked())
             df.to_csv(self.out_tokens.text().strip(), index=False, encoding="utf-8")
             issues.to_csv(self.out_issues.text().strip(), index=False, encoding="utf-8")
             self.log(f"✅ Tokens: {df.shape} → {self.out_tokens.text().strip()}")
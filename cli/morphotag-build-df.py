@@ -1,20 +1,91 @@
 #!/usr/bin/env python3
-import argparse
+import argparse, sys
 from pathlib import Path
-from morphotag.parser import build_df_from_dir_without_pylangacq
+from morphotag.parser import iter_token_frames, iter_token_tables, add_mor_features, TableWriter, TABLE_FORMATS
+from morphotag.pipeline import iter_clean_token_frames, iter_clean_token_tables
+from morphotag.reports import SummaryCounter
 
 def main():
-    ap = argparse.ArgumentParser(description="Construye CSV de tokens (mor/gra) SIN pylangacq")
+    ap = argparse.ArgumentParser(description="Construye la tabla de tokens (mor/gra) SIN pylangacq")
     ap.add_argument("input_dir", help="Carpeta con .cha")
     ap.add_argument("--recursive", action="store_true")
-    ap.add_argument("--out_csv", default="tokens.csv")
-    ap.add_argument("--issues_csv", default="issues.csv")
+    ap.add_argument("--format", default="csv", choices=list(TABLE_FORMATS), help="parquet/feather conservan los tipos (requieren pyarrow)")
+    ap.add_argument("--partition-by", default=None, choices=["file", "speaker"], help="Parte la tabla de tokens en una carpeta por archivo o hablante")
+    ap.add_argument("--normalized", action="store_true", help="Enunciados y tokens en tablas separadas unidas por utt_id (sin repetir el texto por token)")
+    ap.add_argument("--mor-features", action="store_true", help="Añade lemma, suffixes, fusional y clitic_of sacados de mor_rest")
+    ap.add_argument("--clean", action="store_true", help="Limpia cada archivo en memoria antes de analizarlo (como ba2-clean, sin archivos intermedios); sólo entran los que quedan sin errores")
+    ap.add_argument("--clean-out", default=None, help="Con --clean: guarda además el texto limpio en <carpeta>/clean y <carpeta>/needs_review")
+    ap.add_argument("--include-review", action="store_true", help="Con --clean: analiza también los archivos que irían a needs_review")
+    ap.add_argument("--utterances_csv", default=None, help="Con --normalized: salida de enunciados (por defecto utterances.<formato>)")
+    ap.add_argument("--out_csv", default=None, help="Salida de tokens (por defecto tokens.<formato>)")
+    ap.add_argument("--issues_csv", default=None, help="Salida de avisos (por defecto issues.<formato>)")
+    ap.add_argument("--chunk-rows", type=int, default=1_000_000, help="Tokens por trozo al escribir (0 = un trozo por archivo)")
+    ap.add_argument("--jobs", type=int, default=1, help="Procesos en paralelo (0 = todos los núcleos)")
+    ap.add_argument("--no-cache", action="store_true", help="Analiza todo de nuevo sin usar ni guardar la caché")
+    ap.add_argument("--cache-dir", default=None, help="Carpeta de la caché (por defecto $MORPHOTAG_CACHE_DIR o ~/.cache/morphotag)")
+    ap.add_argument("--cache-max-mb", type=int, default=1024, help="Tamaño máximo de la caché de análisis en MB")
     args = ap.parse_args()
+    if args.normalized and args.partition_by:
+        ap.error("--partition-by sólo se aplica a la tabla ancha (sin --normalized)")
+    if (args.clean_out or args.include_review) and not args.clean:
+        ap.error("--clean-out e --include-review requieren --clean")
+    ext = TABLE_FORMATS[args.format]
+    out = args.out_csv or ("tokens" if args.partition_by else "tokens" + ext)
+    issues_out = args.issues_csv or "issues" + ext
+    if args.format != "csv":
+        try:
+            import pyarrow  # noqa: F401
+        except Exception:
+            print("⚠️ Instala primero: pip install pyarrow", file=sys.stderr)
+            sys.exit(2)
 
-    df, df_issues = build_df_from_dir_without_pylangacq(Path(args.input_dir), recursive=args.recursive)
-    df.to_csv(args.out_csv, index=False, encoding="utf-8")
-    df_issues.to_csv(args.issues_csv, index=False, encoding="utf-8")
-    print("Escritos:", args.out_csv, "y", args.issues_csv)
+    # Se escribe por trozos según se analizan: la memoria no depende del tamaño del corpus
+    if args.clean:
+        # La caché de análisis es de los archivos tal cual: aquí se analiza el texto limpio
+        opts = dict(recursive=args.recursive, workers=args.jobs, chunk_rows=args.chunk_rows,
+                    out_dir=args.clean_out, include_review=args.include_review)
+        frames, tables = iter_clean_token_frames, iter_clean_token_tables
+    else:
+        opts = dict(
+            recursive=args.recursive, workers=args.jobs,
+            cache=False if args.no_cache else (args.cache_dir or True),
+            cache_max_bytes=args.cache_max_mb * 1024 * 1024,
+            chunk_rows=args.chunk_rows,
+        )
+        frames, tables = iter_token_frames, iter_token_tables
+    summary = SummaryCounter()
+
+    def with_reports(chunks):
+        # Con --clean cada trozo trae también los informes de limpieza
+        for chunk in chunks:
+            if args.clean:
+                *chunk, reports = chunk
+                for rep in reports:
+                    summary.add(rep)
+            yield chunk
+
+    if args.normalized:
+        utts_out = args.utterances_csv or "utterances" + ext
+        with TableWriter(utts_out, args.format) as utts_w, TableWriter(out, args.format) as tokens_w, \
+             TableWriter(issues_out, args.format) as issues_w:
+            for df_utts, df, df_issues in with_reports(tables(Path(args.input_dir), **opts)):
+                utts_w.write(df_utts)
+                tokens_w.write(add_mor_features(df) if args.mor_features else df)
+                if not df_issues.empty:
+                    issues_w.write(df_issues)
+        if args.clean:
+            print("Limpieza:", summary.text())
+        print("Escritos:", utts_out, ",", out, "y", issues_out)
+        return
+    with TableWriter(out, args.format, partition_by=args.partition_by) as tokens_w, \
+         TableWriter(issues_out, args.format) as issues_w:
+        for df, df_issues in with_reports(frames(Path(args.input_dir), **opts)):
+            tokens_w.write(add_mor_features(df) if args.mor_features else df)
+            if not df_issues.empty:
+                issues_w.write(df_issues)
+    if args.clean:
+        print("Limpieza:", summary.text())
+    print("Escritos:", out, "y", issues_out)
 
 if __name__ == "__main__":
     main()
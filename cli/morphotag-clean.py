@@ -1,6 +1,8 @@
 #!/usr/bin/env python3
 import argparse
-from morphotag.clean import process_dir_to_folders, pretty_summarize_reports
+from pathlib import Path
+from morphotag.clean import iter_process_dir, CLEAN_DIR_NAME, REVIEW_DIR_NAME
+from morphotag.reports import PrettyTextSink, JsonlReportSink, SummaryCounter, feed_sinks
 
 def main():
     ap = argparse.ArgumentParser(description="Limpia/valida .cha y separa en clean/ y needs_review/")
@@ -8,19 +10,28 @@ def main():
     ap.add_argument("--no-rename", action="store_true", help="No renombrar cuando haya cambios (sobrescribe con .bak)")
     ap.add_argument("--missing-policy", default="prefix_com", choices=["prefix_com","drop","report"], help="Líneas sin cabecera (no primeras)")
     ap.add_argument("--empty-policy", default="drop", choices=["drop","keep"], help="Cabeceras vacías")
+    ap.add_argument("--jobs", type=int, default=1, help="Procesos en paralelo (0 = todos los núcleos)")
+    ap.add_argument("--full", action="store_true", help="Reprocesa todo, ignorando el manifiesto de la carpeta")
+    ap.add_argument("--report-jsonl", default=None, help="Guarda además cada informe completo en este .jsonl")
     args = ap.parse_args()
 
-    reports, clean_dir, review_dir = process_dir_to_folders(
+    print("✅ Limpios/arreglados →", Path(args.input_dir) / CLEAN_DIR_NAME)
+    print("🧪 Necesitan revisión →", Path(args.input_dir) / REVIEW_DIR_NAME)
+    print()
+    counter = SummaryCounter()
+    sinks = [PrettyTextSink(), counter]
+    if args.report_jsonl:
+        sinks.append(JsonlReportSink(args.report_jsonl))
+    feed_sinks(iter_process_dir(
         args.input_dir,
         rename_on_change=not args.no_rename,
         backup=True,
         missing_hdr_policy=args.missing_policy,
         empty_hdr_policy=args.empty_policy,
-    )
-    print("✅ Limpios/arreglados →", clean_dir)
-    print("🧪 Necesitan revisión →", review_dir)
-    print()
-    print(pretty_summarize_reports(reports))
+        workers=args.jobs,
+        incremental=not args.full,
+    ), sinks)
+    print(counter.text())
 
 if __name__ == "__main__":
     main()
@@ -1,21 +1,27 @@
 #!/usr/bin/env python3
 import argparse, sys
 from pathlib import Path
-from morphotag.diagnose import diagnose_with_api_pretty, pretty_print_diagnosis
+from morphotag.diagnose import iter_diagnose, pretty_print_diagnosis
 
 def main():
     ap = argparse.ArgumentParser(description="Diagnóstico legible con batchalign.CHATFile API")
     ap.add_argument("path", help="Archivo .cha o carpeta")
     ap.add_argument("--before", type=int, default=3)
     ap.add_argument("--after", type=int, default=3)
+    ap.add_argument("--jobs", type=int, default=1, help="Procesos en paralelo (0 = todos los núcleos); cada uno importa batchalign una vez")
+    ap.add_argument("--no-lint", action="store_true", help="Pasa todos los archivos por batchalign sin el pre-chequeo rápido")
+    ap.add_argument("--no-cache", action="store_true", help="Diagnostica todo de nuevo sin usar ni guardar la caché")
+    ap.add_argument("--cache-dir", default=None, help="Carpeta de la caché (por defecto $MORPHOTAG_CACHE_DIR o ~/.cache/morphotag)")
+    ap.add_argument("--cache-max-mb", type=int, default=1024, help="Tamaño máximo de la caché de diagnósticos en MB")
     args = ap.parse_args()
 
     p = Path(args.path)
     files = [p] if p.is_file() else sorted(p.rglob("*.cha"))
     if not files:
         print("No se encontraron .cha en", p, file=sys.stderr); sys.exit(1)
-    for f in files:
-        d = diagnose_with_api_pretty(str(f), before=args.before, after=args.after)
+    for d in iter_diagnose(files, before=args.before, after=args.after, workers=args.jobs, lint=not args.no_lint,
+                           cache=False if args.no_cache else (args.cache_dir or True),
+                           cache_max_bytes=args.cache_max_mb * 1024 * 1024):
         pretty_print_diagnosis(d)
 
 if __name__ == "__main__":
@@ -0,0 +1,30 @@
+#!/usr/bin/env python3
+import argparse
+from pathlib import Path
+from morphotag.metrics import MetricsStore
+
+def main():
+    ap = argparse.ArgumentParser(description="MLU, TTR, distribución de categorías y desajustes por hablante")
+    ap.add_argument("input_dir", help="Carpeta con .cha")
+    ap.add_argument("--recursive", action="store_true")
+    ap.add_argument("--per-file", action="store_true", help="Una fila por archivo y hablante")
+    ap.add_argument("--out_csv", default="metrics.csv", help="Salida de métricas")
+    ap.add_argument("--pos_csv", default="pos_distribution.csv", help="Salida de la distribución de mor_pos")
+    ap.add_argument("--jobs", type=int, default=1, help="Procesos en paralelo (0 = todos los núcleos)")
+    ap.add_argument("--no-cache", action="store_true", help="No usar la caché de análisis")
+    args = ap.parse_args()
+
+    # Los conteos por archivo se guardan en la carpeta: en la siguiente pasada sólo se
+    # recalculan los archivos nuevos o cambiados
+    with MetricsStore(Path(args.input_dir), recursive=args.recursive) as store:
+        stats = store.update(workers=args.jobs, cache=not args.no_cache)
+        metrics = store.file_metrics() if args.per_file else store.speaker_metrics()
+        pos = store.pos_distribution(per_file=args.per_file)
+    metrics.to_csv(args.out_csv, index=False, encoding="utf-8")
+    pos.to_csv(args.pos_csv, index=False, encoding="utf-8")
+    print(f"Archivos: {stats['added']} nuevos, {stats['updated']} cambiados, {stats['removed']} quitados, "
+          f"{stats['unchanged']} sin cambios")
+    print("Escritos:", args.out_csv, "y", args.pos_csv)
+
+if __name__ == "__main__":
+    main()
@@ -1 +1 @@
-__all__ = ["utils", "clean", "diagnose", "parser"]
\ No newline at end of file
+__all__ = ["utils", "clean", "diagnose", "parser", "reports", "cache", "corpus", "index", "deptree", "metrics", "pipeline"]
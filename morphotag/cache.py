@@ -0,0 +1,93 @@
+import os, shutil, sqlite3, time
+from pathlib import Path
+
+# ---------- caché en disco de resultados por archivo ----------
+# <caché>/<nombre>/<versión>/ guarda un shard por contenido (<sha256><ext>) y un índice
+# SQLite: ruta+tamaño+mtime → sha256 (para no volver a leer archivos sin cambios) y, por
+# shard, su tamaño y último uso (para expulsar los menos usados al pasar de max_bytes).
+# Cambiar la versión invalida todo lo anterior.
+
+CACHE_ENV = "MORPHOTAG_CACHE_DIR"
+DEFAULT_MAX_BYTES = 1 << 30
+INDEX_NAME = "index.sqlite"
+
+def default_cache_dir() -> Path:
+    # $MORPHOTAG_CACHE_DIR, si no $XDG_CACHE_HOME/morphotag (o ~/.cache/morphotag)
+    env = os.environ.get(CACHE_ENV)
+    if env:
+        return Path(env)
+    base = os.environ.get("XDG_CACHE_HOME") or (os.environ.get("LOCALAPPDATA") if os.name == "nt" else None)
+    return (Path(base) if base else Path.home() / ".cache") / "morphotag"
+
+def shard_path(directory: Path, digest: str, ext: str = ".pkl") -> Path:
+    # Se usa también desde los procesos del pool, que sólo reciben la carpeta
+    return Path(directory) / f"{digest}{ext}"
+
+class ShardCache:
+    def __init__(self, name: str, version, directory: str | Path | None = None,
+                 max_bytes: int | None = DEFAULT_MAX_BYTES, ext: str = ".pkl"):
+        base = (Path(directory) if directory else default_cache_dir()) / name
+        self.dir = base / str(version)
+        self.ext = ext
+        self.max_bytes = max_bytes
+        # versiones anteriores: ya no sirven
+        if base.is_dir():
+            for old in base.iterdir():
+                if old.is_dir() and old.name != self.dir.name:
+                    shutil.rmtree(old, ignore_errors=True)
+        self.dir.mkdir(parents=True, exist_ok=True)
+        path = self.dir / INDEX_NAME
+        try:
+            self.con = sqlite3.connect(path, timeout=30)
+            self._create()
+        except sqlite3.DatabaseError:
+            self.con.close(); path.unlink(missing_ok=True)
+            self.con = sqlite3.connect(path, timeout=30)
+            self._create()
+
+    def _create(self):
+        self.con.executescript("""
+            CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, sha256 TEXT);
+            CREATE TABLE IF NOT EXISTS shards (sha256 TEXT PRIMARY KEY, bytes INTEGER, used INTEGER);
+        """)
+
+    def shard_path(self, digest: str) -> Path:
+        return shard_path(self.dir, digest, self.ext)
+
+    def known_digest(self, path: str | Path) -> str | None:
+        # sha256 del contenido si ruta, tamaño y mtime coinciden con lo guardado y el shard sigue ahí
+        path = Path(path)
+        row = self.con.execute("SELECT size, mtime_ns, sha256 FROM files WHERE path = ?",
+                               (os.path.abspath(path),)).fetchone()
+        if not row:
+            return None
+        st = path.stat()
+        if (row[0], row[1]) != (st.st_size, st.st_mtime_ns) or not self.shard_path(row[2]).exists():
+            return None
+        return row[2]
+
+    def record(self, path: str | Path, size: int, mtime_ns: int, digest: str) -> None:
+        shard = self.shard_path(digest)
+        nbytes = shard.stat().st_size if shard.exists() else 0
+        self.con.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)",
+                         (os.path.abspath(path), size, mtime_ns, digest))
+        self.con.execute("INSERT OR REPLACE INTO shards VALUES (?, ?, ?)", (digest, nbytes, time.time_ns()))
+
+    def evict(self) -> int:
+        # Borra los shards usados hace más tiempo hasta quedar por debajo de max_bytes
+        if self.max_bytes is None:
+            return 0
+        total = self.con.execute("SELECT COALESCE(SUM(bytes), 0) FROM shards").fetchone()[0]
+        removed = 0
+        for digest, nbytes in self.con.execute("SELECT sha256, bytes FROM shards ORDER BY used").fetchall():
+            if total <= self.max_bytes:
+                break
+            self.shard_path(digest).unlink(missing_ok=True)
+            self.con.execute("DELETE FROM shards WHERE sha256 = ?", (digest,))
+            self.con.execute("DELETE FROM files WHERE sha256 = ?", (digest,))
+            total -= nbytes; removed += 1
+        return removed
+
+    def close(self) -> None:
+        self.con.commit()
+        self.con.close()
@@ -1,13 +1,23 @@
-import re, shutil
+import hashlib, json, os, re, shutil, sqlite3, time
+from functools import partial
 from pathlib import Path
 from .utils import (
-    MAIN_HDR_RE, DEP_HDR_RE, ANY_HDR_RE, END_RE_LINE, ALLOWED_DEP_TIER_NAMES,
-    split_header_body, parse_id_codes, count_header_occurrences, sanitize_controls,
-    next_nonclobber_name
+    MAIN_HDR_RE, DEP_HDR_RE, END_RE_LINE, INVISIBLE_RE, ALLOWED_DEP_TIER_NAMES,
+    split_header_body, parse_id_codes, parse_id_codes_from_lines, count_header_occurrences,
+    sanitize_line, next_nonclobber_name, map_ordered,
+    file_sha256, write_text_atomic, stage_text, backup_file, free_name, dir_names,
+    sniff_encoding, read_text_sniffed, iter_text_lines, stage_lines
 )
+from .reports import CleanReport, FileCleanReport, pretty_report_text, report_to_json
 
 CLEAN_DIR_NAME = "clean"
 REVIEW_DIR_NAME = "needs_review"
+MANIFEST_NAME = ".morphotag-clean.sqlite"
+MANIFEST_VERSION = 1
+# A partir de este tamaño el archivo se limpia por streaming (memoria acotada)
+STREAM_THRESHOLD = 64 * 1024 * 1024
+
+INITIAL_DEP_RE = re.compile(r'^\s*%[a-z0-9_+-]+\s*:', re.IGNORECASE)
 
 def force_tab_after_headers(text: str):
     lines = text.splitlines()
@@ -84,102 +94,281 @@ def check_and_fix_body(text: str,
                        missing_hdr_policy="prefix_com",
                        empty_hdr_policy="drop",
                        merge_orphan_with_prev_main=True):
+    rep = {"errors": [], "warnings": [], "fixed_lines_prefix_com": [], "dropped_lines": [],
+           "merged_orphan_lines": [], "dropped_initial_missing_header": None}
+    body = _iter_body(
+        text.splitlines(), parse_id_codes(text), rep,
+        allowed_dep_tiers=allowed_dep_tiers,
+        missing_hdr_policy=missing_hdr_policy,
+        empty_hdr_policy=empty_hdr_policy,
+        merge_orphan_with_prev_main=merge_orphan_with_prev_main,
+        fix_headers=False,
+    )
+    text = "\n".join(body)
+    return {
+        "ok": not rep["errors"], "errors": rep["errors"], "warnings": rep["warnings"],
+        "text": text,
+        "fixed_lines": rep["fixed_lines_prefix_com"], "dropped_lines": rep["dropped_lines"],
+        "merged_orphan_lines": rep["merged_orphan_lines"],
+        "dropped_initial_missing_header": rep["dropped_initial_missing_header"],
+    }
+
+def drop_initial_dep_tier_if_present(text: str):
+    start, lines = split_header_body(text)
+    i = start
+    while i < len(lines) and not lines[i].strip():
+        i += 1
+    if i < len(lines):
+        if INITIAL_DEP_RE.match(lines[i].strip()):
+            info = {'line_number': i + 1, 'content': lines[i], 'tier': lines[i].split(':',1)[0][1:]}
+            del lines[i]
+            return "\n".join(lines), info
+    return text, None
+
+# ---------- motor fusionado ----------
+# Las etapas de arriba encadenadas como generadores: cada línea pasa por todas las
+# reglas en el mismo recorrido y el texto se parte y se une una sola vez. Los números
+# de línea de los informes son los mismos que daba la cadena de etapas.
+
+def _end_info(added=False, moved=False, dups_removed=0, changed=False) -> dict:
+    return {"end_added": added, "end_moved": moved, "end_dups_removed": dups_removed, "end_changed": changed}
+
+def _new_clean_report() -> CleanReport:
+    # Tras 'pre' queda un único @End al final y ninguna etapa posterior lo toca,
+    # así que 'post' y 'final' nunca cambian nada.
+    return CleanReport(end_changes={"pre": _end_info(), "post": _end_info(), "final": _end_info()})
+
+def _iter_sanitized(lines, rep: dict, invisibles=True):
+    # invisibles=False: el archivo no tiene controles ni anchos cero (INVISIBLE_RE),
+    # así que basta con quitar espacios iniciales
+    touched = rep["sanitized_lines"]
+    for i, s in enumerate(lines, start=1):
+        if invisibles:
+            new = sanitize_line(s)
+        elif s[:1] == ' ':
+            new = s.lstrip(' ')
+        else:
+            yield s; continue
+        if new != s:
+            touched.append(i)
+        yield new
+
+def _iter_end_at_eof(lines, rep: dict):
+    # ensure_end_at_eof_strict: sólo se retienen los blancos pendientes (pueden ser
+    # finales) y el primer @End hasta saber si queda contenido detrás.
+    pending = []; first_end = None
+    dups = 0; moved = False
+    for ln in lines:
+        if not ln.strip():
+            pending.append(ln); continue
+        if END_RE_LINE.match(ln):
+            if first_end is None:
+                first_end = ln
+                yield from pending; pending.clear()
+            else:
+                dups += 1
+            continue
+        if first_end is not None:
+            moved = True
+        yield from pending; pending.clear()
+        yield ln
+    if pending and pending[-1] == "":
+        pending.pop()                     # "\n".join + splitlines() la perdía
+    if first_end is None:
+        yield "@End"
+        rep["end_changes"]["pre"] = _end_info(added=True, changed=True)
+    else:
+        yield "@End" if moved else first_end
+        rep["end_changes"]["pre"] = _end_info(moved=moved, dups_removed=dups,
+                                              changed=bool(dups or pending or moved))
+
+def _fix_header(m, num: int, rep: dict) -> tuple[str, str]:
+    # force_tab_after_headers + detect_and_fix_double_colon_after_header(mode="remove")
+    hdr, rest = m.group(1), m.group(2).lstrip()
+    if f"{hdr}:\t{rest}" != m.string:
+        rep["tabs_fixed_lines"].append(num)
+    if rest.startswith(':'):
+        rep["double_colon_detected_lines"].append(num)
+        rep["double_colon_fixed_lines"].append(num)
+        rest = rest.lstrip(':').lstrip()
+    return hdr, rest
+
+def _iter_body(lines, id_codes: set, rep: dict,
+               allowed_dep_tiers=None,
+               missing_hdr_policy="prefix_com",
+               empty_hdr_policy="drop",
+               merge_orphan_with_prev_main=True,
+               fix_headers=True):
+    # Validación del cuerpo en un solo recorrido hacia delante. 'n_out' es el índice de
+    # la línea en la salida, que es el número que se da en errores y avisos. Sólo se
+    # retiene la última *CODE: y los blancos que la siguen, por si llega una huérfana
+    # que haya que fusionar con ella. Con fix_headers también aplica, en la misma
+    # pasada, la tabulación y el ':' duplicado tras la cabecera.
     if allowed_dep_tiers is None:
         allowed_dep_tiers = ALLOWED_DEP_TIER_NAMES
-    id_codes = parse_id_codes(text)
-    start, lines = split_header_body(text)
-    errors, warnings, fixed_lines, dropped_lines = [], [], [], []
-    merged_orphan_lines = []
-    dropped_initial_missing_header = None
+    allowed_lower = {t.lower() for t in allowed_dep_tiers}
+    allowed_txt = str(sorted(allowed_dep_tiers))
+    codes_txt = str(sorted(id_codes))
+    errors, warnings = rep["errors"], rep["warnings"]
 
-    i = start
-    first_body_seen = False
-    while i < len(lines):
-        s = lines[i]
-        num = i + 1
-        if not s.strip():
-            i += 1; continue
-        if not first_body_seen:
-            first_body_seen = True
-        if END_RE_LINE.match(s.strip()):
-            i += 1; continue
+    in_header = True; start = 0; n_out = 0
+    held = []; held_at = 0; merged = []
+    for n_in, s in enumerate(lines, start=1):
+        m_main = MAIN_HDR_RE.match(s)
+        m_hdr = m_main or DEP_HDR_RE.match(s)
+        if m_hdr and fix_headers:
+            hdr, rest = _fix_header(m_hdr, n_in, rep)
+            s = f"{hdr}:\t{rest}"
+        elif m_hdr:
+            hdr, rest = m_hdr.group(1), m_hdr.group(2)
+        stripped = s.strip()
+        if in_header:
+            if not stripped or s.lstrip().startswith('@'):
+                n_out += 1; yield s; continue
+            in_header = False; start = n_out
+        num = n_out + 1
+
+        if not stripped:
+            if held: held.append(s)
+            else: yield s
+            n_out += 1; continue
+        if END_RE_LINE.match(stripped):
+            yield from _flush_held(held, merged); held = []
+            n_out += 1; yield s; continue
 
         occ = count_header_occurrences(s)
         if occ > 1:
             errors.append(f"L{num}: hay {occ} cabeceras en la misma línea.")
 
-        m_main = re.match(MAIN_HDR_RE, s)
-        m_dep  = re.match(DEP_HDR_RE, s)
-
-        if m_main:
-            code, rest = m_main.group(1)[1:], m_main.group(2)
-            if code not in id_codes:
-                errors.append(f"L{num}: '*{code}:' no coincide con ningún código de @ID {sorted(id_codes)}")
-            if rest.strip() == "":
-                msg = f"L{num}: cabecera '*{code}:' sin contenido."
-                if empty_hdr_policy == "drop":
-                    lines.pop(i); dropped_lines.append(num); errors.append(msg + " (eliminada)"); continue
-                else:
-                    errors.append(msg)
-            i += 1; continue
-
-        if m_dep:
-            tier, rest = m_dep.group(1)[1:], m_dep.group(2)
-            if tier.lower() not in {t.lower() for t in allowed_dep_tiers}:
-                errors.append(f"L{num}: '%{tier}:' no permitida. Permitidas: {sorted(allowed_dep_tiers)}")
-            if rest.strip() == "":
-                msg = f"L{num}: cabecera '%{tier}:' sin contenido."
+        if m_hdr:
+            if m_main:
+                if hdr[1:] not in id_codes:
+                    errors.append(f"L{num}: '{hdr}:' no coincide con ningún código de @ID {codes_txt}")
+            elif hdr[1:].lower() not in allowed_lower:
+                errors.append(f"L{num}: '{hdr}:' no permitida. Permitidas: {allowed_txt}")
+            if not rest.strip():
+                msg = f"L{num}: cabecera '{hdr}:' sin contenido."
                 if empty_hdr_policy == "drop":
-                    lines.pop(i); dropped_lines.append(num); errors.append(msg + " (eliminada)"); continue
-                else:
-                    errors.append(msg)
-            i += 1; continue
+                    rep["dropped_lines"].append(num); errors.append(msg + " (eliminada)"); continue
+                errors.append(msg)
+            yield from _flush_held(held, merged)
+            if m_main and merge_orphan_with_prev_main:
+                held = [s]; held_at = n_out
+            else:
+                held = []; yield s
+            n_out += 1; continue
 
         # Texto sin cabecera
-        if first_body_seen and num == (start + 1):
-            dropped_initial_missing_header = {'line_number': num, 'content': s}
-            lines.pop(i); continue
-
-        if merge_orphan_with_prev_main:
-            j = i - 1
-            while j >= 0 and not lines[j].strip():
-                j -= 1
-            if j >= 0 and re.match(MAIN_HDR_RE, lines[j]):
-                hdr_m = re.match(MAIN_HDR_RE, lines[j])
-                hdr, rest_prev = hdr_m.group(1), hdr_m.group(2)
-                new_prev = f"{hdr}:\t{rest_prev.rstrip()} {s.strip()}".rstrip()
-                lines[j] = new_prev
-                lines.pop(i)
-                merged_orphan_lines.append({'line_number': num, 'into_line': j + 1})
-                continue
+        if n_out == start:
+            rep["dropped_initial_missing_header"] = {'line_number': num, 'content': s}
+            continue
+
+        if held:
+            merged.append(stripped)
+            rep["merged_orphan_lines"].append({'line_number': num, 'into_line': held_at + 1})
+            continue
 
         msg = f"L{num}: línea con texto sin cabecera (*CODE: o %tier:)."
         if missing_hdr_policy == "prefix_com":
-            lines[i] = f"%com:\t{s.strip()}"; fixed_lines.append(num); warnings.append(msg + " (prefijada como '%com:')."); i += 1
+            yield f"%com:\t{stripped}"; n_out += 1
+            rep["fixed_lines_prefix_com"].append(num); warnings.append(msg + " (prefijada como '%com:').")
         elif missing_hdr_policy == "drop":
-            lines.pop(i); dropped_lines.append(num); warnings.append(msg + " (eliminada).")
+            rep["dropped_lines"].append(num); warnings.append(msg + " (eliminada).")
         else:
-            errors.append(msg); i += 1
+            errors.append(msg); yield s; n_out += 1
+    yield from _flush_held(held, merged)
 
-    return {
-        "ok": not errors, "errors": errors, "warnings": warnings,
-        "text": "\n".join(lines),
-        "fixed_lines": fixed_lines, "dropped_lines": dropped_lines,
-        "merged_orphan_lines": merged_orphan_lines,
-        "dropped_initial_missing_header": dropped_initial_missing_header,
-    }
+def _flush_held(held: list, merged: list) -> list:
+    # Fusionar k huérfanas de una en una daba f"{hdr}:\t{rest.rstrip()} {s}" anidado
+    # k veces: k tabuladores y las huérfanas unidas por espacios. Se construye una vez.
+    if merged:
+        m = MAIN_HDR_RE.match(held[0])
+        tabs = "\t" * len(merged)
+        held[0] = f"{m.group(1)}:{tabs}{m.group(2).rstrip()} {' '.join(merged)}"
+        merged.clear()
+    return held
 
-def drop_initial_dep_tier_if_present(text: str):
-    start, lines = split_header_body(text)
-    i = start
-    while i < len(lines) and not lines[i].strip():
-        i += 1
-    if i < len(lines):
-        if re.match(r'^\s*%[a-z0-9_+-]+\s*:', lines[i].strip(), flags=re.IGNORECASE):
-            info = {'line_number': i + 1, 'content': lines[i], 'tier': lines[i].split(':',1)[0][1:]}
-            del lines[i]
-            return "\n".join(lines), info
-    return text, None
+def _iter_drop_initial_dep(lines, rep: dict):
+    # drop_initial_dep_tier_if_present
+    it = iter(lines)
+    for i, s in enumerate(it):
+        if s.strip() and not s.lstrip().startswith('@'):
+            if INITIAL_DEP_RE.match(s.strip()):
+                rep["initial_dep_removed"] = {'line_number': i + 1, 'content': s, 'tier': s.split(':', 1)[0][1:]}
+            else:
+                yield s
+            break
+        yield s
+    yield from it
+
+def clean_text(text: str,
+               allowed_dep_tiers=None,
+               missing_hdr_policy="prefix_com",
+               empty_hdr_policy="drop",
+               merge_orphan_with_prev_main=True):
+    rep = _new_clean_report()
+    invisibles = INVISIBLE_RE.search(text) is not None
+    lines = list(_iter_end_at_eof(_iter_sanitized(text.splitlines(), rep, invisibles), rep))
+    body = _iter_body(
+        lines, parse_id_codes_from_lines(lines), rep,
+        allowed_dep_tiers=allowed_dep_tiers,
+        missing_hdr_policy=missing_hdr_policy,
+        empty_hdr_policy=empty_hdr_policy,
+        merge_orphan_with_prev_main=merge_orphan_with_prev_main,
+    )
+    text = "\n".join(_iter_drop_initial_dep(body, rep)) + "\n"
+    rep["tabs_fixed_count"] = len(rep["tabs_fixed_lines"])
+    return text, rep
+
+def _clean_path(path: Path, **policy) -> tuple[str, str, dict]:
+    text = read_text_sniffed(path)
+    return text, *clean_text(text, **policy)
+
+def clean_file_streaming(path: str | Path, out_dir: str | Path,
+                         allowed_dep_tiers=None,
+                         missing_hdr_policy="prefix_com",
+                         empty_hdr_policy="drop",
+                         merge_orphan_with_prev_main=True):
+    # clean_text sin tener el archivo entero en memoria: se lee dos veces por trozos
+    # (la primera sólo para los códigos de @ID, que hacen falta antes del cuerpo) y la
+    # salida va directa a un temporal en out_dir. Sólo se retienen la última *CODE: con
+    # sus huérfanas y los blancos pendientes. Devuelve (changed, rep, temporal o None).
+    path = Path(path)
+    encoding, errors = sniff_encoding(path)
+    scratch = _new_clean_report()
+    id_codes = parse_id_codes_from_lines(
+        _iter_end_at_eof(_iter_sanitized(iter_text_lines(path, encoding, errors), scratch), scratch))
+
+    rep = _new_clean_report()
+    h_in = hashlib.sha256()
+    lines = _iter_end_at_eof(_iter_sanitized(iter_text_lines(path, encoding, errors, hasher=h_in), rep), rep)
+    body = _iter_body(
+        lines, id_codes, rep,
+        allowed_dep_tiers=allowed_dep_tiers,
+        missing_hdr_policy=missing_hdr_policy,
+        empty_hdr_policy=empty_hdr_policy,
+        merge_orphan_with_prev_main=merge_orphan_with_prev_main,
+    )
+    staged, h_out = stage_lines(out_dir, _iter_drop_initial_dep(body, rep))
+    rep["tabs_fixed_count"] = len(rep["tabs_fixed_lines"])
+    changed = h_out != h_in.digest()
+    if not changed:
+        staged.unlink(); staged = None
+    return changed, rep, staged
+
+def _use_streaming(path: Path, streaming) -> bool:
+    # streaming=None: automático según el tamaño del archivo
+    return path.stat().st_size >= STREAM_THRESHOLD if streaming is None else bool(streaming)
+
+def _file_report(path: Path, rep: CleanReport, changed: bool, output_path: Path, renamed: bool) -> FileCleanReport:
+    return FileCleanReport(
+        file=str(path),
+        renamed_to=(str(output_path) if renamed else None),
+        changed=changed,
+        ok=not rep["errors"],
+        **rep,
+        output_path=str(output_path),
+    )
 
 def process_file(path: str | Path,
                  rename_on_change=True,
@@ -187,145 +376,207 @@ def process_file(path: str | Path,
                  allowed_dep_tiers=None,
                  missing_hdr_policy="prefix_com",
                  empty_hdr_policy="drop",
-                 merge_orphan_with_prev_main=True):
+                 merge_orphan_with_prev_main=True,
+                 streaming=None):
     path = Path(path)
-    try:
-        text = path.read_text(encoding="utf-8")
-    except UnicodeDecodeError:
-        text = path.read_text(errors="ignore")
-    original_text = text
-
-    text, sanitized_lines = sanitize_controls(text)
-    text, end_info_pre = ensure_end_at_eof_strict(text)
-    text, tabs_fixed_count, tabs_fixed_lines = force_tab_after_headers(text)
-    text, dblcol_changed, dblcol_detected = detect_and_fix_double_colon_after_header(text, mode="remove")
-
-    rep_body = check_and_fix_body(
-        text,
+    policy = dict(
         allowed_dep_tiers=allowed_dep_tiers,
         missing_hdr_policy=missing_hdr_policy,
         empty_hdr_policy=empty_hdr_policy,
         merge_orphan_with_prev_main=merge_orphan_with_prev_main,
     )
-    text = rep_body["text"]
-
-    text, end_info_post = ensure_end_at_eof_strict(text)
-    text, initial_dep_removed = drop_initial_dep_tier_if_present(text)
-    text, end_info_final = ensure_end_at_eof_strict(text)
-
-    changed = (text != original_text)
+    if _use_streaming(path, streaming):
+        changed, rep, staged = clean_file_streaming(path, path.parent, **policy)
+    else:
+        original_text, text, rep = _clean_path(path, **policy)
+        changed = (text != original_text); staged = None
     wrote_path = path
     if changed:
         if rename_on_change:
             wrote_path = next_nonclobber_name(path, suffix=".fix")
-            wrote_path.write_text(text, encoding="utf-8")
+        elif backup:
+            backup_file(path, path.with_suffix(path.suffix + ".bak"))
+        if staged is not None:
+            os.replace(staged, wrote_path)
         else:
-            if backup:
-                shutil.copy2(path, path.with_suffix(path.suffix + ".bak"))
-            path.write_text(text, encoding="utf-8")
+            write_text_atomic(wrote_path, text)
 
-    final_ok = (len(rep_body["errors"]) == 0)
+    return _file_report(path, rep, changed, wrote_path, renamed=(wrote_path != path))
 
-    return {
-        "file": str(path),
-        "renamed_to": (str(wrote_path) if wrote_path != path else None),
-        "changed": changed,
-        "ok": final_ok,
-        "tabs_fixed_count": tabs_fixed_count,
-        "tabs_fixed_lines": tabs_fixed_lines,
-        "double_colon_fixed_lines": dblcol_changed,
-        "double_colon_detected_lines": dblcol_detected,
-        "fixed_lines_prefix_com": rep_body["fixed_lines"],
-        "dropped_lines": rep_body["dropped_lines"],
-        "merged_orphan_lines": rep_body["merged_orphan_lines"],
-        "dropped_initial_missing_header": rep_body["dropped_initial_missing_header"],
-        "initial_dep_removed": initial_dep_removed,
-        "sanitized_lines": sanitized_lines,
-        "errors": rep_body["errors"],
-        "warnings": rep_body["warnings"],
-        "end_changes": {"pre": end_info_pre, "post": end_info_post, "final": end_info_final},
-        "output_path": str(wrote_path if changed else path),
-    }
+# ---------- manifiesto (re-limpieza incremental) ----------
+# <carpeta>/.morphotag-clean.sqlite guarda, por ruta relativa, el hash del contenido,
+# la política de limpieza (incluido qué se hace con el original: rename_on_change y
+# backup), el informe y el destino final. Un archivo con el mismo contenido y política
+# cuyo destino sigue existiendo no se vuelve a procesar.
+# Es SQLite para consultar y escribir fila a fila sin cargar todos los informes.
 
-def process_dir_to_folders(input_dir: str | Path,
-                           rename_on_change=True,
-                           backup=True,
-                           allowed_dep_tiers=None,
-                           missing_hdr_policy="prefix_com",
-                           empty_hdr_policy="drop"):
+def _policy_key(allowed_dep_tiers, missing_hdr_policy, empty_hdr_policy, rename_on_change, backup) -> str:
+    tiers = ALLOWED_DEP_TIER_NAMES if allowed_dep_tiers is None else allowed_dep_tiers
+    return json.dumps([sorted(tiers), missing_hdr_policy, empty_hdr_policy, bool(rename_on_change), bool(backup)],
+                      ensure_ascii=False)
+
+def open_manifest(input_dir: str | Path) -> sqlite3.Connection:
+    path = Path(input_dir) / MANIFEST_NAME
+    try:
+        con = sqlite3.connect(path)
+        version = con.execute("PRAGMA user_version").fetchone()[0]
+    except sqlite3.DatabaseError:
+        con.close(); path.unlink(missing_ok=True)
+        con = sqlite3.connect(path); version = None
+    if version != MANIFEST_VERSION:
+        con.executescript(f"""
+            DROP TABLE IF EXISTS files;
+            CREATE TABLE files (rel TEXT PRIMARY KEY, sha256 TEXT, size INTEGER, mtime_ns INTEGER,
+                                policy TEXT, dest TEXT, report TEXT, run INTEGER);
+            PRAGMA user_version = {MANIFEST_VERSION};
+        """)
+    return con
+
+def _manifest_hit(con: sqlite3.Connection, rel: str, cha: Path, input_dir: Path, policy: str) -> bool:
+    row = con.execute("SELECT sha256, size, mtime_ns, policy, dest FROM files WHERE rel = ?", (rel,)).fetchone()
+    if not row:
+        return False
+    sha256, size, mtime_ns, row_policy, dest = row
+    if row_policy != policy or not (input_dir / dest).exists():
+        return False
+    st = cha.stat()
+    if (size, mtime_ns) == (st.st_size, st.st_mtime_ns):
+        return True
+    return sha256 == file_sha256(cha)
+
+def _clean_into(path: Path, target_dirs: tuple[Path, Path], streaming=None, **policy):
+    # Trabajo de cada proceso: limpia y, si hay cambios, deja el texto ya en su carpeta
+    # final (clean/ o needs_review/) como temporal; el nombre definitivo lo pone el padre.
+    # hash y stat antes de limpiar, para el manifiesto.
+    st = path.stat()
+    digest = file_sha256(path)
+    if _use_streaming(path, streaming):
+        # Los errores sólo se conocen al terminar: el temporal va a clean/ y el padre
+        # lo mueve a needs_review/ si hace falta (mismo sistema de archivos).
+        changed, rep, staged = clean_file_streaming(path, target_dirs[0], **policy)
+    else:
+        original_text, text, rep = _clean_path(path, **policy)
+        changed = (text != original_text)
+        staged = stage_text(target_dirs[0 if not rep["errors"] else 1], text) if changed else None
+    return digest, st.st_size, st.st_mtime_ns, changed, rep, staged
+
+def _discard_staged(result):
+    # Resultado de _clean_into que no llegó a colocarse: fuera su temporal
+    if result[-1] is not None:
+        Path(result[-1]).unlink(missing_ok=True)
+
+def iter_process_dir(input_dir: str | Path,
+                     rename_on_change=True,
+                     backup=True,
+                     allowed_dep_tiers=None,
+                     missing_hdr_policy="prefix_com",
+                     empty_hdr_policy="drop",
+                     workers: int | None = 1,
+                     incremental=True,
+                     streaming=None):
+    # Como process_dir_to_folders, pero devuelve cada informe en cuanto su archivo
+    # está colocado (en orden) sin acumularlos. Ver morphotag.reports para consumirlos.
     input_dir = Path(input_dir)
     clean_dir = input_dir / CLEAN_DIR_NAME
     review_dir = input_dir / REVIEW_DIR_NAME
     clean_dir.mkdir(parents=True, exist_ok=True)
     review_dir.mkdir(parents=True, exist_ok=True)
 
-    reports = []
-    for cha in sorted(input_dir.rglob("*.cha")):
-        if clean_dir in cha.parents or review_dir in cha.parents:
-            continue
-        rep = process_file(
-            cha,
-            rename_on_change=rename_on_change,
-            backup=backup,
-            allowed_dep_tiers=allowed_dep_tiers,
-            missing_hdr_policy=missing_hdr_policy,
-            empty_hdr_policy=empty_hdr_policy,
-        )
-        reports.append(rep)
-        src_path = Path(rep["output_path"])
-        target_dir = clean_dir if rep["ok"] else review_dir
-        target_path = target_dir / src_path.name
-        i = 1
-        while target_path.exists():
-            target_path = target_dir / f"{src_path.stem}.{i}{src_path.suffix}"
-            i += 1
-        shutil.move(str(src_path), str(target_path))
-    return reports, str(clean_dir), str(review_dir)
+    chas = [cha for cha in sorted(input_dir.rglob("*.cha"))
+            if not (clean_dir in cha.parents or review_dir in cha.parents)]
+    policy = _policy_key(allowed_dep_tiers, missing_hdr_policy, empty_hdr_policy, rename_on_change, backup)
+    con = open_manifest(input_dir)
+    run = time.time_ns()
+    # Con incremental=False no se leen aciertos, pero el manifiesto se actualiza igual
+    cached = [incremental and _manifest_hit(con, cha.relative_to(input_dir).as_posix(), cha, input_dir, policy)
+              for cha in chas]
+    todo = [cha for cha, hit in zip(chas, cached) if not hit]
 
-def pretty_summarize_reports(reports: list[dict]) -> str:
-    lines = []
-    for rep in reports:
-        status = "OK" if rep["ok"] else "REVISAR"
-        renamed = f" → guardado como: {rep['renamed_to']}" if rep["renamed_to"] else ""
-        lines.append(f"Archivo: {rep['file']}  [{status}]{renamed}")
-        if rep.get("sanitized_lines"):
-            lines.append(f"  · Saneado de invisibles en líneas: {rep['sanitized_lines']}")
-        if rep.get("tabs_fixed_count"):
-            lines.append(f"  · Tabulación tras cabeceras corregida en {rep['tabs_fixed_count']} líneas: {rep['tabs_fixed_lines']}")
-        if rep.get("double_colon_detected_lines"):
-            if rep.get("double_colon_fixed_lines"):
-                lines.append(f"  · ':' duplicado tras cabecera corregido en: {rep['double_colon_fixed_lines']}")
+    # Índices en memoria de nombres ocupados (en lugar de probar con exists()):
+    # los .cha de cada carpeta de origen y todo lo que ya hay en clean/ y needs_review/.
+    src_taken = {}
+    for cha in chas:
+        src_taken.setdefault(cha.parent, set()).add(os.path.normcase(cha.name))
+    taken = {clean_dir: dir_names(clean_dir), review_dir: dir_names(review_dir)}
+
+    clean_one = partial(
+        _clean_into,
+        target_dirs=(clean_dir, review_dir),
+        allowed_dep_tiers=allowed_dep_tiers,
+        missing_hdr_policy=missing_hdr_policy,
+        empty_hdr_policy=empty_hdr_policy,
+        streaming=streaming,
+    )
+    # La limpieza va en paralelo; los nombres se asignan aquí, en orden, para que
+    # los destinos en clean/ y needs_review/ sean los mismos que en serie.
+    # Cada resultado se escribe una sola vez: el temporal se renombra a su nombre final.
+    # Si el consumidor para antes (break, excepción, rerun de la UI), los temporales de
+    # los resultados ya hechos que no se llegaron a colocar se borran al cerrar
+    results = map_ordered(clean_one, todo, workers=workers, discard=_discard_staged)
+    complete = False
+    try:
+        for n, (cha, hit) in enumerate(zip(chas, cached), start=1):
+            rel = cha.relative_to(input_dir).as_posix()
+            if hit:
+                con.execute("UPDATE files SET run = ? WHERE rel = ?", (run, rel))
+                report_json, = con.execute("SELECT report FROM files WHERE rel = ?", (rel,)).fetchone()
+                yield FileCleanReport.from_dict(json.loads(report_json))
+                continue
+            digest, size, mtime_ns, changed, rep, staged = next(results)
+            target_dir = clean_dir if not rep["errors"] else review_dir
+            renamed = changed and rename_on_change
+            name = free_name(src_taken[cha.parent], f"{cha.stem}.fix", cha.suffix) if renamed else cha.name
+            target_path = target_dir / free_name(taken[target_dir], Path(name).stem, cha.suffix)
+            taken[target_dir].add(os.path.normcase(target_path.name))
+            if changed:
+                os.replace(staged, target_path)
+                if not rename_on_change:
+                    # el original sobrescrito salía de la carpeta: ahora sólo pasa a ser la copia .bak
+                    if backup:
+                        os.replace(cha, cha.with_suffix(cha.suffix + ".bak"))
+                    else:
+                        cha.unlink()
             else:
-                lines.append(f"  · ':' duplicado tras cabecera detectado en: {rep['double_colon_detected_lines']}")
-        if rep.get("dropped_initial_missing_header"):
-            info = rep["dropped_initial_missing_header"]
-            lines.append(f"  · Línea {info['line_number']} (primera del cuerpo) sin cabecera → BORRADA.")
-        if rep.get("initial_dep_removed"):
-            info = rep["initial_dep_removed"]
-            lines.append(f"  · Primera línea del cuerpo era '%{info['tier']}:' → BORRADA.")
-        if rep.get("merged_orphan_lines"):
-            pairs = ", ".join([f"L{x['line_number']}→L{x['into_line']}" for x in rep["merged_orphan_lines"]])
-            lines.append(f"  · Huérfanas fusionadas con la anterior *CODE:: {pairs}")
-        if rep.get("fixed_lines_prefix_com"):
-            lines.append(f"  · Líneas sin cabecera prefijadas como %com: {rep['fixed_lines_prefix_com']}")
-        if rep.get("dropped_lines"):
-            lines.append(f"  · Cabeceras vacías eliminadas en líneas: {rep['dropped_lines']}")
-        end_pre, end_post, end_final = rep["end_changes"]["pre"], rep["end_changes"]["post"], rep["end_changes"]["final"]
-        msgs = []
-        for tag, info in (("pre", end_pre), ("post", end_post), ("final", end_final)):
-            parts = []
-            if info.get("end_added"): parts.append("añadido")
-            if info.get("end_moved"): parts.append("recolocado")
-            if info.get("end_dups_removed"): parts.append(f"duplicados eliminados={info['end_dups_removed']}")
-            if parts:
-                msgs.append(f"{tag}: " + ", ".join(parts))
-        if msgs:
-            lines.append("  · @End → " + " | ".join(msgs))
-        if rep.get("errors"):
-            lines.append("  × Errores restantes:")
-            lines.extend([f"    - {e}" for e in rep["errors"]])
-        if rep.get("warnings"):
-            lines.append("  ⚠ Avisos:")
-            lines.extend([f"    - {w}" for w in rep["warnings"]])
-        lines.append("")
-    return "\n".join(lines)
+                shutil.move(str(cha), str(target_path))
+            rep = _file_report(cha, rep, changed, target_path, renamed)
+            con.execute(
+                "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (rel, digest, size, mtime_ns, policy, target_path.relative_to(input_dir).as_posix(),
+                 report_to_json(rep), run),
+            )
+            if n % 500 == 0:
+                con.commit()
+            yield rep
+        complete = True
+    finally:
+        results.close()
+        if complete:
+            con.execute("DELETE FROM files WHERE run != ?", (run,))
+        con.commit()
+        con.close()
+
+def process_dir_to_folders(input_dir: str | Path,
+                           rename_on_change=True,
+                           backup=True,
+                           allowed_dep_tiers=None,
+                           missing_hdr_policy="prefix_com",
+                           empty_hdr_policy="drop",
+                           workers: int | None = 1,
+                           incremental=True,
+                           streaming=None):
+    reports = list(iter_process_dir(
+        input_dir,
+        rename_on_change=rename_on_change,
+        backup=backup,
+        allowed_dep_tiers=allowed_dep_tiers,
+        missing_hdr_policy=missing_hdr_policy,
+        empty_hdr_policy=empty_hdr_policy,
+        workers=workers,
+        incremental=incremental,
+        streaming=streaming,
+    ))
+    input_dir = Path(input_dir)
+    return reports, str(input_dir / CLEAN_DIR_NAME), str(input_dir / REVIEW_DIR_NAME)
+
+def pretty_summarize_reports(reports: list[dict]) -> str:
+    return "\n".join(pretty_report_text(rep) for rep in reports)
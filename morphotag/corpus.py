@@ -0,0 +1,91 @@
+import operator
+from functools import partial
+from pathlib import Path
+from typing import Dict, List, Optional
+import pandas as pd
+from .parser import TOKEN_COLUMNS, TokenColumns, _cha_files, _parse_file
+from .utils import map_ordered
+
+# ---------- consultas perezosas sobre una carpeta de .cha ----------
+# Corpus(carpeta).where(speaker="CHI", mor_pos="v").columns("word", "mor_pos").to_frame()
+# No se lee nada hasta to_frame()/iter_frames(). Los filtros se aplican mientras se
+# recorre cada archivo: por file, antes de abrirlo; por speaker/utt_index/utterance_text,
+# antes de partir los %mor/%gra del enunciado; el resto, token a token.
+# Cada condición puede ser un valor (igualdad), un conjunto/lista/tupla (pertenencia) o
+# una función valor → bool (con workers > 1 tiene que poder serializarse: nada de lambdas).
+
+def _predicate(cond):
+    if callable(cond):
+        return cond
+    if isinstance(cond, (set, frozenset, list, tuple)):
+        return frozenset(cond).__contains__
+    return partial(operator.eq, cond)
+
+def _all_of(preds, value) -> bool:
+    return all(p(value) for p in preds)
+
+class Corpus:
+    def __init__(self, folder: str | Path, recursive: bool = False, workers: int | None = 1):
+        self.folder = Path(folder)
+        self.recursive = recursive
+        self.workers = workers
+        self._where: Dict[str, list] = {}
+        self._columns = TOKEN_COLUMNS
+
+    def _copy(self) -> "Corpus":
+        new = Corpus(self.folder, self.recursive, self.workers)
+        new._where = {c: list(preds) for c, preds in self._where.items()}
+        new._columns = self._columns
+        return new
+
+    def where(self, **conditions) -> "Corpus":
+        # Se acumulan: where(a=1).where(a=...) exige las dos
+        new = self._copy()
+        for col, cond in conditions.items():
+            if col not in TOKEN_COLUMNS:
+                raise ValueError(f"Columna desconocida: {col!r} (usa {', '.join(TOKEN_COLUMNS)})")
+            new._where.setdefault(col, []).append(_predicate(cond))
+        return new
+
+    def columns(self, *names: str) -> "Corpus":
+        unknown = [c for c in names if c not in TOKEN_COLUMNS]
+        if unknown:
+            raise ValueError(f"Columnas desconocidas: {unknown} (usa {', '.join(TOKEN_COLUMNS)})")
+        new = self._copy()
+        new._columns = tuple(names) if names else TOKEN_COLUMNS
+        return new
+
+    def files(self) -> List[Path]:
+        files = _cha_files(self.folder, self.recursive)
+        preds = self._where.get("file")
+        return [f for f in files if _all_of(preds, f.name)] if preds else files
+
+    def _pushdown(self) -> Optional[Dict[str, object]]:
+        # Una función por columna para el parser (file ya se aplicó al elegir archivos)
+        where = {c: (preds[0] if len(preds) == 1 else partial(_all_of, preds))
+                 for c, preds in self._where.items() if c != "file"}
+        return where or None
+
+    def _iter_columns(self, chunk_rows: Optional[int] = None):
+        parse = partial(_parse_file, where=self._pushdown())
+        cols = TokenColumns()
+        for file_cols, _ in map_ordered(parse, self.files(), workers=self.workers):
+            cols.extend(file_cols)
+            if chunk_rows and len(cols) >= chunk_rows:
+                yield cols
+                cols = cols.fresh()
+        if len(cols) or not chunk_rows:
+            yield cols
+
+    def iter_frames(self, chunk_rows: int = 1_000_000):
+        # El resultado por trozos de unos chunk_rows tokens (un archivo nunca se parte)
+        for cols in self._iter_columns(chunk_rows):
+            yield cols.to_frame(columns=self._columns)
+
+    def to_frame(self) -> pd.DataFrame:
+        cols, = self._iter_columns()
+        return cols.to_frame(columns=self._columns)
+
+    def __repr__(self):
+        conds = ", ".join(self._where) or "-"
+        return f"Corpus({str(self.folder)!r}, where=[{conds}], columns={list(self._columns)})"
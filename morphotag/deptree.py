@@ -0,0 +1,90 @@
+from pathlib import Path
+from typing import Dict
+import numpy as np
+import pandas as pd
+from .cache import DEFAULT_MAX_BYTES
+from .parser import TokenColumns, _iter_chunks
+
+# ---------- árboles de dependencias (%gra) como arrays ----------
+# Todo se calcula sobre los arrays CSR de TokenColumns.gra_csr() (heads + offsets) para
+# todos los enunciados a la vez, sin recorrer árboles en Python:
+#   · el padre de cada token es un índice global (offsets[u] + head - 1)
+#   · la profundidad sale de saltos de punteros: en cada paso cada token suma la distancia
+#     de su ancestro y salta al ancestro de éste, así que basta log2(longitud) pasos
+#   · lo que tras esos pasos no llega a una raíz ni a un head inválido está en un ciclo
+#     (o cuelga de uno)
+# head inválido: falta en %gra, apunta fuera del enunciado o a sí mismo.
+
+TREE_COLUMNS = ("n_tokens", "n_roots", "n_bad_heads", "has_cycle", "valid_tree", "depth",
+                "mean_dep_distance", "max_dep_distance")
+
+def token_tree_arrays(heads: np.ndarray, offsets: np.ndarray) -> Dict[str, np.ndarray]:
+    # Por token: utt (nº de enunciado en offsets), depth (aristas hasta la raíz; -1 si no
+    # llega), dep_distance (|head - posición|; 0 en raíces y heads inválidos), is_root,
+    # bad_head, in_cycle
+    n = np.diff(offsets)
+    utt = np.repeat(np.arange(len(n), dtype=np.int64), n)
+    idx = np.arange(len(heads), dtype=np.int64)
+    pos = idx - offsets[:-1][utt] + 1
+    is_root = heads == 0
+    bad = (heads < 0) | (heads > n[utt]) | (heads == pos)
+    fixed = is_root | bad
+    anc = np.where(fixed, idx, offsets[:-1][utt] + heads - 1)
+    dist = (~fixed).astype(np.int64)
+    for _ in range(int(n.max(initial=1)).bit_length()):
+        dist, anc = dist + dist[anc], anc[anc]
+    reached = is_root[anc]
+    in_cycle = ~reached & ~bad[anc]
+    return {
+        "utt": utt,
+        "depth": np.where(reached, dist, -1),
+        "dep_distance": np.where(fixed, 0, np.abs(heads - pos)),
+        "is_root": is_root, "bad_head": bad, "in_cycle": in_cycle,
+    }
+
+def tree_metrics_arrays(heads: np.ndarray, offsets: np.ndarray) -> Dict[str, np.ndarray]:
+    # Por enunciado (TREE_COLUMNS). depth es la profundidad máxima (-1 si ningún token
+    # llega a la raíz); las distancias son de los tokens con head válido que no son raíz
+    # (NaN / -1 si no hay ninguno)
+    t = token_tree_arrays(heads, offsets)
+    n_utt = len(offsets) - 1
+    count = lambda w: np.bincount(t["utt"], weights=w, minlength=n_utt).astype(np.int64)
+    n_tokens = np.diff(offsets)
+    n_roots = count(t["is_root"]); n_bad = count(t["bad_head"])
+    has_cycle = count(t["in_cycle"]) > 0
+    depth = np.full(n_utt, -1, dtype=np.int64); np.maximum.at(depth, t["utt"], t["depth"])
+    linked = ~t["is_root"] & ~t["bad_head"]
+    n_linked = count(linked)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean_dist = np.bincount(t["utt"], weights=t["dep_distance"], minlength=n_utt) / n_linked
+    max_dist = np.full(n_utt, -1, dtype=np.int64); np.maximum.at(max_dist, t["utt"][linked], t["dep_distance"][linked])
+    return {
+        "n_tokens": n_tokens, "n_roots": n_roots, "n_bad_heads": n_bad, "has_cycle": has_cycle,
+        "valid_tree": (n_tokens > 0) & (n_roots == 1) & (n_bad == 0) & ~has_cycle,
+        "depth": depth, "mean_dep_distance": mean_dist, "max_dep_distance": max_dist,
+    }
+
+def tree_metrics(cols: TokenColumns) -> pd.DataFrame:
+    # Un enunciado por fila: file, speaker, utt_index y TREE_COLUMNS
+    heads, offsets = cols.gra_csr()
+    df = pd.DataFrame({c: cols.column(c, per_utterance=True) for c in ("file", "speaker", "utt_index")})
+    for c, v in tree_metrics_arrays(heads, offsets).items():
+        df[c] = v
+    return df
+
+def iter_tree_metrics(folder: str | Path, recursive: bool = False, workers: int | None = 1,
+                      cache: bool | str | Path | None = None,
+                      cache_max_bytes: int | None = DEFAULT_MAX_BYTES,
+                      chunk_rows: int | None = 1_000_000):
+    # tree_metrics de una carpeta por trozos de unos chunk_rows tokens
+    for cols, _ in _iter_chunks(folder, recursive, workers, cache, cache_max_bytes, chunk_rows):
+        yield tree_metrics(cols)
+
+def tree_metrics_from_dir(folder: str | Path, recursive: bool = False, workers: int | None = 1,
+                          cache: bool | str | Path | None = None,
+                          cache_max_bytes: int | None = DEFAULT_MAX_BYTES) -> pd.DataFrame:
+    frames = list(iter_tree_metrics(folder, recursive, workers, cache, cache_max_bytes))
+    if not frames:
+        return tree_metrics(TokenColumns())
+    df = pd.concat(frames, ignore_index=True)
+    return df.astype({"file": "category", "speaker": "category"})
@@ -1,5 +1,12 @@
-import re, traceback
+import json, re, traceback
+from bisect import bisect_right
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from itertools import accumulate
 from pathlib import Path
+from .cache import DEFAULT_MAX_BYTES, ShardCache
+from .utils import (ALLOWED_DEP_TIER_NAMES, END_RE_LINE, file_sha256, map_ordered, parse_id_codes_from_lines,
+                    resolve_workers, write_bytes_atomic)
 
 def render_invisibles(s: str, show_tabs=True, show_ctrl=True) -> str:
     out = []
@@ -13,8 +20,36 @@ def render_invisibles(s: str, show_tabs=True, show_ctrl=True) -> str:
             out.append(ch)
     return "".join(out)
 
-def context_block(chat_text: str, center_line: int, before=3, after=3) -> list[str]:
-    lines = chat_text.splitlines()
+class ChatLines:
+    # Índice de líneas de un .cha, hecho una vez por archivo y compartido por la búsqueda
+    # del enunciado y el contexto: las líneas, su versión con espacios colapsados unida en
+    # un solo texto y dónde empieza cada línea en él. Buscar en el texto unido (str.find)
+    # encuentra también los enunciados partidos en líneas de continuación.
+    __slots__ = ("lines", "_joined", "_starts")
+
+    def __init__(self, text: str):
+        self.lines = text.splitlines()
+        self._joined = None; self._starts = None
+
+    def __len__(self):
+        return len(self.lines)
+
+    def find(self, utterance: str) -> int | None:
+        # Línea (desde 1) donde empieza la primera aparición del enunciado
+        if self._joined is None:
+            norm = [" ".join(ln.split()) for ln in self.lines]
+            self._joined = " ".join(norm)
+            self._starts = [0, *accumulate(len(n) + 1 for n in norm[:-1])] if norm else []
+        at = self._joined.find(_normalize_ws(utterance))
+        if at < 0 or not self.lines:
+            return None
+        return bisect_right(self._starts, at)
+
+def _chat_lines(chat_text: "str | ChatLines") -> ChatLines:
+    return chat_text if isinstance(chat_text, ChatLines) else ChatLines(chat_text)
+
+def context_block(chat_text: "str | ChatLines", center_line: int, before=3, after=3) -> list[str]:
+    lines = _chat_lines(chat_text).lines
     n = len(lines)
     if center_line is None or center_line < 1 or center_line > n:
         return []
@@ -40,35 +75,161 @@ def _utterance_from_trace(text_or_trace: str) -> str | None:
 def _normalize_ws(s: str) -> str:
     return " ".join(s.split())
 
-def _find_utterance_line_in_chat(chat_text: str, utterance: str) -> int | None:
+def _find_utterance_line_in_chat(chat_text: "str | ChatLines", utterance: str) -> int | None:
     if not utterance: return None
-    target = _normalize_ws(utterance)
-    for i, ln in enumerate(chat_text.splitlines(), start=1):
-        if target in _normalize_ws(ln):
-            return i
-    return None
+    return _chat_lines(chat_text).find(utterance)
+
+# Sugerencias por tipo de problema (las mismas para batchalign y para lint_chat)
+_HINTS = {
+    "unclosed_group": "Posible grupo '<...>' sin cierre '>' en ese enunciado.",
+    "unknown_speaker": "Código de hablante no reconocido: *XXX: debe existir en @Participants y @ID (campo 3).",
+    "tier_not_allowed": "Tier dependiente no permitido: permite %com, %err, %sit, %mor, %gra, %act (o amplía la lista).",
+    "end": "Debe existir un único @End y ser la última línea con contenido.",
+    "tab_colon": "Tras la cabecera debe haber un TAB (no espacio) y no debe quedar ':' extra tras el TAB.",
+    "no_header": "Cada línea debe empezar por *CODE:, %tier:, @cabecera o un TAB (continuación).",
+}
 
 def _friendly_hints_from_message(msg_lower: str, utterance: str | None):
     hints = []
     if "unexpected end to utterance within form group" in msg_lower:
-        hints.append("Posible grupo '<...>' sin cierre '>' en ese enunciado.")
+        hints.append(_HINTS["unclosed_group"])
         if utterance and '<' in utterance and '>' not in utterance[utterance.rfind('<')+1:]:
             hints.append("En el enunciado capturado hay '<' pero no se ve '>' después.")
     if "unknown speaker" in msg_lower or "unknown code" in msg_lower:
-        hints.append("Código de hablante no reconocido: *XXX: debe existir en @Participants y @ID (campo 3).")
+        hints.append(_HINTS["unknown_speaker"])
     if "dependent tier" in msg_lower or "unknown tier" in msg_lower:
-        hints.append("Tier dependiente no permitido: permite %com, %err, %sit, %mor, %gra, %act (o amplía la lista).")
+        hints.append(_HINTS["tier_not_allowed"])
     if "@end" in msg_lower or "end tag" in msg_lower:
-        hints.append("Debe existir un único @End y ser la última línea con contenido.")
+        hints.append(_HINTS["end"])
     if "tab" in msg_lower or "tabulation" in msg_lower or "colon" in msg_lower:
-        hints.append("Tras la cabecera debe haber un TAB (no espacio) y no debe quedar ':' extra tras el TAB.")
+        hints.append(_HINTS["tab_colon"])
     return hints or None
 
+# ---------- pre-chequeo rápido (sin batchalign) ----------
+# lint_chat busca directamente los fallos que más a menudo hacen fallar CHATFile (los de
+# _HINTS), todos y con su línea exacta. diagnose_tiered sólo llama a batchalign si el
+# archivo lo pasa limpio.
+
+TIER_LINE_RE = re.compile(r'^(\s*)([*%])([^\s:]*)(\s*):(.*)$')
+MAIN_CODE_RE = re.compile(r'^[A-Za-z0-9]{1,7}$')
+# Códigos entre corchetes ([<], [>], [/]...) y el enlazador +< no abren ni cierran grupos
+GROUP_TOKEN_RE = re.compile(r'\[[^\]]*\]|\+<|[<>]')
+
+def _group_findings(segments: list[tuple[int, str]]) -> list[dict]:
+    # segments: (línea, texto) del enunciado con sus líneas de continuación
+    open_at = []; out = []
+    for num, text in segments:
+        for m in GROUP_TOKEN_RE.finditer(text):
+            tok = m.group(0)
+            if tok == "<":
+                open_at.append(num)
+            elif tok == ">":
+                if open_at:
+                    open_at.pop()
+                else:
+                    out.append({"line": num, "kind": "unclosed_group", "message": "'>' sin '<' que lo abra."})
+    out.extend({"line": num, "kind": "unclosed_group", "message": "'<' sin cierre '>' en el enunciado."}
+               for num in open_at)
+    return out
+
+def lint_chat(text: "str | ChatLines", allowed_dep_tiers=None) -> list[dict]:
+    # [{"line", "kind", "message"}] ordenados por línea; vacía si no se ve nada raro
+    allowed = {t.lower() for t in (ALLOWED_DEP_TIER_NAMES if allowed_dep_tiers is None else allowed_dep_tiers)}
+    lines = _chat_lines(text).lines
+    id_codes = parse_id_codes_from_lines(lines)
+    out = []; ends = []; after_end = None
+    utt = None  # segmentos del enunciado principal en curso
+    tier = False  # hay un tier abierto al que pueden seguir líneas de continuación
+    for num, ln in enumerate(lines, start=1):
+        if num == 1:
+            ln = ln.lstrip("\ufeff")  # BOM (el saneado del limpiador también lo quita)
+        if not ln.strip():
+            continue
+        if ends and after_end is None and not END_RE_LINE.match(ln):
+            after_end = num
+        if ln[:1] == "\t" and tier:
+            if utt is not None:
+                utt.append((num, ln))
+            continue
+        if utt is not None:
+            out.extend(_group_findings(utt)); utt = None
+        tier = False
+        if ln.lstrip().startswith("@"):
+            if END_RE_LINE.match(ln):
+                ends.append(num)
+            tier = True  # también las cabeceras @ pueden seguir en líneas con TAB
+            continue
+        m = TIER_LINE_RE.match(ln)
+        if not m:
+            out.append({"line": num, "kind": "no_header", "message": "línea con texto sin cabecera."})
+            continue
+        lead, mark, name, gap, rest = m.groups()
+        hdr = f"{mark}{name}"; tier = True
+        if lead:
+            out.append({"line": num, "kind": "tab_colon", "message": f"espacios antes de '{hdr}:'."})
+        if gap:
+            out.append({"line": num, "kind": "tab_colon", "message": f"espacio entre '{hdr}' y ':'."})
+        if rest and rest[0] != "\t":
+            out.append({"line": num, "kind": "tab_colon", "message": f"tras '{hdr}:' falta el TAB."})
+        if rest.strip().startswith(":"):
+            out.append({"line": num, "kind": "tab_colon", "message": f"':' de más tras '{hdr}:'."})
+        if mark == "*":
+            if not MAIN_CODE_RE.match(name) or name not in id_codes:
+                out.append({"line": num, "kind": "unknown_speaker",
+                            "message": f"'{hdr}:' no coincide con ningún código de @ID {sorted(id_codes)}."})
+            utt = [(num, rest)]
+        elif name.lower() not in allowed:
+            out.append({"line": num, "kind": "tier_not_allowed",
+                        "message": f"'{hdr}:' no permitida. Permitidas: {sorted(allowed)}."})
+    if utt is not None:
+        out.extend(_group_findings(utt))
+    if not ends:
+        out.append({"line": len(lines), "kind": "end", "message": "falta @End."})
+    for num in ends[1:]:
+        out.append({"line": num, "kind": "end", "message": "@End repetido."})
+    if after_end is not None:
+        out.append({"line": after_end, "kind": "end", "message": "contenido después de @End."})
+    return sorted(out, key=lambda f: f["line"])
+
+_batchalign = None
+
+def _import_batchalign():
+    # Una importación por proceso (es lo que más tarda en archivos pequeños)
+    global _batchalign
+    if _batchalign is None:
+        import batchalign
+        _batchalign = batchalign
+    return _batchalign
+
+def _batchalign_version() -> str | None:
+    # Versión instalada sin importar batchalign si se puede (importarlo tarda); None si
+    # no está: entonces no se usa la caché (el error de importación no debe quedar guardado)
+    try:
+        from importlib.metadata import version
+        return version("batchalign")
+    except Exception:
+        pass
+    try:
+        return str(getattr(_import_batchalign(), "__version__", "unknown"))
+    except Exception:
+        return None
+
+def _warm_worker():
+    # Inicializador de los procesos de DiagnosisPool: importa batchalign al arrancar.
+    # Si falla, el error sale en el diagnóstico de cada archivo, como en serie.
+    try:
+        _import_batchalign()
+    except Exception:
+        pass
+
 def diagnose_with_api_pretty(cha_path: str, before=3, after=3):
     cha_path = str(cha_path)
-    txt = Path(cha_path).read_text(encoding="utf-8", errors="ignore")
+    txt = ChatLines(Path(cha_path).read_text(encoding="utf-8", errors="ignore"))
+    return _diagnose_api(cha_path, txt, before, after)
+
+def _diagnose_api(cha_path: str, txt: ChatLines, before=3, after=3):
     try:
-        import batchalign as ba
+        ba = _import_batchalign()
         chat = ba.CHATFile(path=cha_path)
         _ = chat.doc
         return {"ok": True, "file": cha_path}
@@ -88,13 +249,139 @@ def diagnose_with_api_pretty(cha_path: str, before=3, after=3):
             "trace": tb,
         }
 
+def diagnose_tiered(cha_path: str, before=3, after=3, allowed_dep_tiers=None):
+    # Primero lint_chat; batchalign sólo si no encuentra nada. Mismo dict que
+    # diagnose_with_api_pretty más "source" ("lint" o "batchalign") y, si el fallo es de
+    # lint, "lint" con todos los problemas (el contexto es el del primero)
+    cha_path = str(cha_path)
+    txt = ChatLines(Path(cha_path).read_text(encoding="utf-8", errors="ignore"))
+    findings = lint_chat(txt, allowed_dep_tiers=allowed_dep_tiers)
+    if not findings:
+        return {**_diagnose_api(cha_path, txt, before, after), "source": "batchalign"}
+    first = findings[0]["line"]
+    return {
+        "ok": False, "file": cha_path, "source": "lint",
+        "error_type": "CHATFormat", "message": f"{len(findings)} problema(s) de formato CHAT.",
+        "py_line": None, "utterance": None,
+        "cha_line": first, "context_block": context_block(txt, first, before=before, after=after),
+        "hints": list(dict.fromkeys(_HINTS[f["kind"]] for f in findings)),
+        "trace": None, "lint": findings,
+    }
+
+# ---------- caché de diagnósticos ----------
+# Un shard JSON por contenido (sha256) dentro de la carpeta de la versión de batchalign
+# (y de DIAGNOSE_CACHE_VERSION): otra versión de batchalign o de estas reglas invalida lo
+# anterior. Cada shard guarda un diagnóstico por opciones (before, after, modo), también
+# los ok. Como en la caché de análisis, el índice ruta+tamaño+mtime evita releer y hashear
+# los archivos sin cambios. Al leer uno se pone la ruta actual del archivo (el mismo
+# contenido pudo diagnosticarse con otra).
+
+DIAGNOSE_CACHE_VERSION = 2
+
+def _content_digest(dc: ShardCache, path: str):
+    # (sha256, tamaño, mtime_ns); None si no se puede leer
+    try:
+        st = Path(path).stat()
+        return dc.known_digest(path) or file_sha256(path), st.st_size, st.st_mtime_ns
+    except OSError:
+        return None
+
+def _load_entries(shard: Path) -> dict:
+    try:
+        entries = json.loads(shard.read_text(encoding="utf-8"))
+        return entries if isinstance(entries, dict) else {}
+    except Exception:
+        return {}
+
+def _cached_diagnosis(entry, path: str) -> dict | None:
+    try:
+        old, diag = entry["file"], entry["diag"]
+    except Exception:
+        return None
+    for k in ("message", "trace"):
+        if diag.get(k): diag[k] = diag[k].replace(old, path)
+    diag["file"] = path
+    return diag
+
+class DiagnosisPool:
+    # Procesos de larga vida que importan batchalign una vez y se reutilizan entre
+    # llamadas a imap (p. ej. varios clics en la UI). Con workers=1 se diagnostica en
+    # este mismo proceso.
+    def __init__(self, workers: int | None = 1):
+        self.workers = resolve_workers(workers)
+        self._ex = None
+
+    def _map(self, fn, files):
+        if self.workers <= 1:
+            return map(fn, files)
+        if self._ex is None:
+            self._ex = ProcessPoolExecutor(max_workers=self.workers, initializer=_warm_worker)
+        return map_ordered(fn, files, workers=self.workers, chunksize=1, executor=self._ex)
+
+    def imap(self, files, before=3, after=3, lint=False, cache: bool | str | Path | None = None,
+             cache_max_bytes: int | None = DEFAULT_MAX_BYTES):
+        # Diagnósticos (dicts de diagnose_with_api_pretty) en el orden de files, según
+        # van terminando; con pocos archivos por proceso en vuelo. lint: diagnose_tiered.
+        # cache: True (carpeta por defecto, ver morphotag.cache) o una carpeta → los
+        # archivos ya diagnosticados con el mismo contenido y opciones salen de la caché
+        # sin pasar por los procesos
+        fn = partial(diagnose_tiered if lint else diagnose_with_api_pretty, before=before, after=after)
+        files = [str(f) for f in files]
+        version = _batchalign_version() if cache else None
+        if version is None:
+            yield from self._map(fn, files)
+            return
+        version = re.sub(r"[^\w.+-]", "_", version)
+        dc = ShardCache("diagnose", f"{DIAGNOSE_CACHE_VERSION}-{version}",
+                        directory=None if cache is True else cache, max_bytes=cache_max_bytes, ext=".json")
+        opts = f"{before}:{after}:{'lint' if lint else 'api'}"
+        fresh = None
+        try:
+            known = [_content_digest(dc, f) for f in files]
+            entries = [_load_entries(dc.shard_path(k[0])) if k else {} for k in known]
+            hits = [_cached_diagnosis(e.get(opts), f) for f, e in zip(files, entries)]
+            fresh = self._map(fn, [f for f, h in zip(files, hits) if h is None])
+            for f, k, saved, diag in zip(files, known, entries, hits):
+                if diag is None:
+                    diag = next(fresh)
+                    if k:
+                        saved[opts] = {"file": f, "diag": diag}
+                        write_bytes_atomic(dc.shard_path(k[0]), json.dumps(saved, ensure_ascii=False).encode("utf-8"))
+                if k:
+                    dc.record(f, k[1], k[2], k[0])
+                yield diag
+            dc.evict()
+        finally:
+            if hasattr(fresh, "close"): fresh.close()
+            dc.close()
+
+    def close(self):
+        if self._ex is not None:
+            self._ex.shutdown(cancel_futures=True)
+            self._ex = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def iter_diagnose(files, before=3, after=3, workers: int | None = 1, lint=False,
+                  cache: bool | str | Path | None = None, cache_max_bytes: int | None = DEFAULT_MAX_BYTES):
+    # Un pool sólo para esta pasada
+    with DiagnosisPool(workers) as pool:
+        yield from pool.imap(files, before=before, after=after, lint=lint, cache=cache,
+                             cache_max_bytes=cache_max_bytes)
+
 def pretty_print_diagnosis(diag: dict):
     if diag.get("ok"):
         print(f"✅ {diag['file']}: sin errores al parsear (API)."); return
     print(f"❌ {diag['file']}: {diag.get('error_type','Error')}")
     if diag.get("message"): print(f"   Mensaje: {diag['message']}")
     if diag.get("py_line") is not None: print(f"   (traceback) última 'line N': {diag['py_line']}")
-    if diag.get("cha_line") is not None: print(f"   Línea estimada en .cha: {diag['cha_line']}")
+    if diag.get("lint"):
+        print("   Problemas (pre-chequeo, sin batchalign):"); [print(f"    L{f['line']}: {f['message']}") for f in diag["lint"]]
+    elif diag.get("cha_line") is not None: print(f"   Línea estimada en .cha: {diag['cha_line']}")
     if diag.get("utterance"): print(f"   Enunciado capturado: «{diag['utterance']}»")
     if diag.get("context_block"):
         print("   Contexto:"); [print("   ", ln) for ln in diag["context_block"]]
@@ -0,0 +1,250 @@
+import hashlib, sqlite3
+from pathlib import Path
+from typing import Dict, List
+import numpy as np
+import pandas as pd
+from .parser import PARSER_VERSION, TokenColumns, _cha_files, _iter_parsed
+
+# ---------- índice invertido (concordancias por stem / mor_pos / deprel) ----------
+# <carpeta>/.morphotag-index.sqlite guarda, por (campo, valor, archivo), las posiciones
+# de los tokens como un blob de int64 ordenados: (utt_index << TOK_BITS) | token_index.
+# Al consultar se les añade el id del archivo y todo se resuelve con operaciones de
+# conjuntos de numpy sobre esas claves, sin tocar los .cha.
+#
+#   idx = CorpusIndex("corpus"); idx.update()
+#   idx.search(Term(stem="perro", mor_pos="n"))                # tokens
+#   idx.search(Term(mor_pos="det").then(Term(mor_pos="n")))    # adyacencia: det seguido de n
+#   idx.search(Term(stem="ir") & ~Term(deprel="NEG"))          # enunciados (booleanas)
+
+INDEX_NAME = ".morphotag-index.sqlite"
+INDEX_VERSION = 1
+FIELDS = ("stem", "mor_pos", "deprel")
+TOK_BITS, UTT_BITS, FILE_BITS = 15, 24, 24
+TOK_MASK = (1 << TOK_BITS) - 1
+UTT_SHIFT = TOK_BITS
+FILE_SHIFT = TOK_BITS + UTT_BITS
+_EMPTY = np.empty(0, dtype=np.int64)
+
+def _file_postings(cols: TokenColumns) -> Dict[str, Dict[str, np.ndarray]]:
+    # campo → valor → claves (utt, token) ordenadas de un archivo
+    tok = np.array(cols.token_index, dtype=np.int64)
+    utt = cols._per_token(np.array(cols.utt_index, dtype=np.int64))
+    if len(tok) and (tok.max() > TOK_MASK or utt.max() >= 1 << UTT_BITS):
+        raise ValueError("Enunciado o token fuera del rango del índice")
+    keys = (utt << UTT_SHIFT) | tok
+    out = {}
+    for field, column in (("stem", "word"), ("mor_pos", "mor_pos"), ("deprel", "deprel")):
+        if column == "word":
+            codes, values = pd.factorize(pd.Series(cols.word, dtype=object), use_na_sentinel=True)
+        else:
+            codes = np.frombuffer(cols.codes[column], dtype=np.int32) if len(cols) else np.empty(0, np.int32)
+            values = list(cols.categories[column])
+        out[field] = {}
+        order = np.argsort(codes, kind="stable")
+        codes_sorted = codes[order]
+        bounds = np.flatnonzero(np.diff(codes_sorted)) + 1
+        for group in np.split(order, bounds):
+            if not len(group) or codes[group[0]] < 0:
+                continue
+            out[field][str(values[codes[group[0]]])] = np.sort(keys[group])
+    return out
+
+def _scan_files(con: sqlite3.Connection, folder: Path, recursive: bool):
+    # Compara la carpeta con la tabla files (file_id, rel, size, mtime_ns, sha256):
+    # → (nuevos o cambiados, file_id de los que ya no están, nº sin cambios). Los cambiados
+    # son (ruta, rel, stat, sha256, file_id o None si es nuevo). Si sólo cambió la fecha
+    # pero no el contenido, se actualiza la fila y cuenta como sin cambios.
+    known = {rel: (fid, size, mtime_ns, sha) for fid, rel, size, mtime_ns, sha in
+             con.execute("SELECT file_id, rel, size, mtime_ns, sha256 FROM files")}
+    todo = []; unchanged = 0; seen = set()
+    for f in _cha_files(folder, recursive):
+        rel = f.relative_to(folder).as_posix(); seen.add(rel)
+        st = f.stat(); row = known.get(rel)
+        if row and (row[1], row[2]) == (st.st_size, st.st_mtime_ns):
+            unchanged += 1; continue
+        digest = hashlib.sha256(f.read_bytes()).hexdigest()
+        if row and row[3] == digest:
+            con.execute("UPDATE files SET size = ?, mtime_ns = ? WHERE file_id = ?",
+                        (st.st_size, st.st_mtime_ns, row[0]))
+            unchanged += 1; continue
+        todo.append((f, rel, st, digest, row[0] if row else None))
+    return todo, [known[rel][0] for rel in set(known) - seen], unchanged
+
+class _Query:
+    def __and__(self, other): return _Bool(np.intersect1d, self, other)
+    def __or__(self, other): return _Bool(np.union1d, self, other)
+    def __sub__(self, other): return _Bool(np.setdiff1d, self, other)
+    def __invert__(self): return _Not(self)
+
+    def utterances(self, idx: "CorpusIndex") -> np.ndarray:
+        return np.unique(self.tokens(idx) >> UTT_SHIFT)
+
+class Term(_Query):
+    # Un token que cumple todos los campos; cada valor puede ser un str o varios (o)
+    def __init__(self, **fields):
+        unknown = [f for f in fields if f not in FIELDS]
+        if unknown or not fields:
+            raise ValueError(f"Campos de búsqueda: {', '.join(FIELDS)}")
+        self.fields = {f: ([v] if isinstance(v, str) else list(v)) for f, v in fields.items()}
+
+    def then(self, *others: "Term") -> "Seq":
+        return Seq(self, *others)
+
+    def tokens(self, idx: "CorpusIndex") -> np.ndarray:
+        result = None
+        for field, values in self.fields.items():
+            keys = np.unique(np.concatenate([idx._postings(field, v) for v in values]))
+            result = keys if result is None else np.intersect1d(result, keys, assume_unique=True)
+        return result
+
+    def __repr__(self):
+        return f"Term({', '.join(f'{k}={v!r}' for k, v in self.fields.items())})"
+
+class Seq(_Query):
+    # Términos en tokens consecutivos del mismo enunciado; devuelve el primer token
+    def __init__(self, *terms: Term):
+        self.terms = terms
+
+    def then(self, *others: Term) -> "Seq":
+        return Seq(*self.terms, *others)
+
+    def tokens(self, idx: "CorpusIndex") -> np.ndarray:
+        start = self.terms[0].tokens(idx)
+        for offset, term in enumerate(self.terms[1:], start=1):
+            start = start[(start & TOK_MASK) + offset <= TOK_MASK]
+            start = start[np.isin(start + offset, term.tokens(idx), assume_unique=True)]
+        return start
+
+class _Bool(_Query):
+    # Combinaciones a nivel de enunciado
+    def __init__(self, op, left: _Query, right: _Query):
+        self.op, self.left, self.right = op, left, right
+
+    def tokens(self, idx):
+        raise TypeError("Las combinaciones booleanas devuelven enunciados, no tokens")
+
+    def utterances(self, idx):
+        # a & ~b es a - b: no hace falta la lista de todos los enunciados
+        if self.op is np.intersect1d and isinstance(self.right, _Not):
+            return np.setdiff1d(self.left.utterances(idx), self.right.query.utterances(idx))
+        return self.op(self.left.utterances(idx), self.right.utterances(idx))
+
+class _Not(_Query):
+    # Sólo tiene sentido dentro de un '&' (a & ~b) o respecto a todos los enunciados
+    def __init__(self, query: _Query):
+        self.query = query
+
+    def tokens(self, idx):
+        raise TypeError("~ devuelve enunciados, no tokens")
+
+    def utterances(self, idx):
+        return np.setdiff1d(idx._all_utterances(), self.query.utterances(idx))
+
+class CorpusIndex:
+    def __init__(self, folder: str | Path, recursive: bool = False, path: str | Path | None = None):
+        self.folder = Path(folder)
+        self.recursive = recursive
+        self.path = Path(path) if path else self.folder / INDEX_NAME
+        try:
+            self.con = sqlite3.connect(self.path)
+            version = self.con.execute("PRAGMA user_version").fetchone()[0]
+        except sqlite3.DatabaseError:
+            self.con.close(); self.path.unlink(missing_ok=True)
+            self.con = sqlite3.connect(self.path); version = None
+        # El índice depende de lo que produce el parser: si cambia, se rehace
+        if version != INDEX_VERSION * 1000 + PARSER_VERSION:
+            self.con.executescript(f"""
+                DROP TABLE IF EXISTS files;
+                DROP TABLE IF EXISTS postings;
+                CREATE TABLE files (file_id INTEGER PRIMARY KEY, rel TEXT UNIQUE, size INTEGER,
+                                    mtime_ns INTEGER, sha256 TEXT, utterances BLOB);
+                CREATE TABLE postings (field TEXT, value TEXT, file_id INTEGER, keys BLOB,
+                                       PRIMARY KEY (field, value, file_id)) WITHOUT ROWID;
+                CREATE INDEX postings_file ON postings (file_id);
+                PRAGMA user_version = {INDEX_VERSION * 1000 + PARSER_VERSION};
+            """)
+        self._names = None
+
+    def close(self):
+        self.con.commit()
+        self.con.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # ----- actualización incremental -----
+    def update(self, workers: int | None = 1, cache: bool | str | Path | None = None) -> Dict[str, int]:
+        # Reindexa sólo los archivos nuevos o cambiados (tamaño/mtime y, si no coinciden,
+        # hash) y quita los que ya no están. Devuelve cuántos hay de cada caso.
+        todo, removed, unchanged = _scan_files(self.con, self.folder, self.recursive)
+        stats = {"added": 0, "updated": 0, "removed": len(removed), "unchanged": unchanged}
+        for fid in removed:
+            self._drop(fid); self.con.execute("DELETE FROM files WHERE file_id = ?", (fid,))
+        parsed = _iter_parsed([t[0] for t in todo], workers=workers, cache=cache)
+        for (f, rel, st, digest, fid), (cols, _) in zip(todo, parsed):
+            if fid is not None:
+                self._drop(fid)
+                stats["updated"] += 1
+            else:
+                fid = self.con.execute("INSERT INTO files (rel) VALUES (?)", (rel,)).lastrowid
+                stats["added"] += 1
+            if fid >= 1 << FILE_BITS:
+                raise ValueError("Demasiados archivos para el índice")
+            utts = np.array(cols.utt_index, dtype=np.int64)
+            self.con.execute("UPDATE files SET size = ?, mtime_ns = ?, sha256 = ?, utterances = ? WHERE file_id = ?",
+                             (st.st_size, st.st_mtime_ns, digest, utts.tobytes(), fid))
+            self.con.executemany(
+                "INSERT INTO postings VALUES (?, ?, ?, ?)",
+                ((field, value, fid, keys.tobytes())
+                 for field, by_value in _file_postings(cols).items() for value, keys in by_value.items()),
+            )
+            self.con.commit()
+        self.con.commit()
+        self._names = None
+        return stats
+
+    def _drop(self, fid: int):
+        self.con.execute("DELETE FROM postings WHERE file_id = ?", (fid,))
+
+    # ----- consultas -----
+    def _postings(self, field: str, value: str) -> np.ndarray:
+        parts = [np.frombuffer(blob, dtype=np.int64) | (fid << FILE_SHIFT) for fid, blob in self.con.execute(
+            "SELECT file_id, keys FROM postings WHERE field = ? AND value = ?", (field, value))]
+        return np.concatenate(parts) if parts else _EMPTY
+
+    def _all_utterances(self) -> np.ndarray:
+        parts = [(np.frombuffer(blob, dtype=np.int64) | (fid << UTT_BITS)) for fid, blob in
+                 self.con.execute("SELECT file_id, utterances FROM files") if blob is not None]
+        return np.unique(np.concatenate(parts)) if parts else _EMPTY
+
+    def _file_names(self) -> Dict[int, str]:
+        if self._names is None:
+            self._names = dict(self.con.execute("SELECT file_id, rel FROM files"))
+        return self._names
+
+    def values(self, field: str) -> List[str]:
+        # Valores distintos de un campo (para autocompletar consultas)
+        return [v for v, in self.con.execute("SELECT DISTINCT value FROM postings WHERE field = ? ORDER BY value", (field,))]
+
+    def _files_column(self, fids: np.ndarray) -> pd.Categorical:
+        names = self._file_names()
+        uniq, inverse = np.unique(fids, return_inverse=True)
+        return pd.Categorical.from_codes(inverse, categories=[names[int(i)] for i in uniq])
+
+    def search(self, query: _Query) -> pd.DataFrame:
+        # Term/Seq → (file, utt_index, token_index); combinaciones con & | - ~ → (file, utt_index)
+        if isinstance(query, (Term, Seq)):
+            keys = np.sort(query.tokens(self))
+            return pd.DataFrame({
+                "file": self._files_column(keys >> FILE_SHIFT),
+                "utt_index": (keys >> UTT_SHIFT) & ((1 << UTT_BITS) - 1),
+                "token_index": keys & TOK_MASK,
+            })
+        keys = np.sort(query.utterances(self))
+        return pd.DataFrame({
+            "file": self._files_column(keys >> UTT_BITS),
+            "utt_index": keys & ((1 << UTT_BITS) - 1),
+        })
@@ -0,0 +1,180 @@
+import sqlite3
+from pathlib import Path
+from typing import Dict, Sequence
+import numpy as np
+import pandas as pd
+from .index import _scan_files
+from .parser import PARSER_VERSION, TokenColumns, _iter_parsed
+
+# ---------- métricas por hablante (MLU, TTR, categorías, desajustes) ----------
+# Todo sale de conteos parciales por (file, speaker) en formato largo: kind/key/n con
+#   utterances  enunciados con al menos una palabra
+#   words       tokens con mor_pos que no son PUNCT
+#   tokens      todos los tokens
+#   mismatches  tokens con diag_mismatch
+#   pos         palabras por mor_pos (key = categoría)
+#   type        palabras por forma en minúsculas (key = forma)
+# Sumar conteos de varios archivos da los del conjunto, así que los totales no necesitan
+# la tabla de tokens: MetricsStore guarda los parciales de cada archivo y al cambiar uno
+# sólo se rehacen los suyos.
+#
+#   store = MetricsStore("corpus"); store.update()
+#   store.speaker_metrics(); store.file_metrics(); store.pos_distribution()
+
+METRICS_NAME = ".morphotag-metrics.sqlite"
+METRICS_VERSION = 1
+COUNT_COLUMNS = ("file", "speaker", "kind", "key", "n")
+METRIC_COLUMNS = ("n_utterances", "n_words", "mlu", "n_types", "ttr", "n_tokens", "n_mismatches", "mismatch_rate")
+_SCALAR_KINDS = ("utterances", "words", "tokens", "mismatches")
+
+def _group_counts(kind: str, group: np.ndarray, n_groups: int, weights=None,
+                  key: np.ndarray | None = None, key_names=None) -> pd.DataFrame:
+    # Conteos por grupo (y por key si se da) con bincount sobre códigos enteros
+    if key is None:
+        n = np.bincount(group, weights=weights, minlength=n_groups).astype(np.int64)
+        hit = np.flatnonzero(n)
+        return pd.DataFrame({"g": hit, "kind": kind, "key": "", "n": n[hit]})
+    pair, n = np.unique(group * len(key_names) + key, return_counts=True)
+    return pd.DataFrame({"g": pair // len(key_names), "kind": kind,
+                         "key": np.asarray(key_names, dtype=object)[pair % len(key_names)], "n": n})
+
+def _counts(file, speaker, utt, mor_pos, word, mismatch) -> pd.DataFrame:
+    # Núcleo de partial_counts: un valor por token en cada argumento (utt identifica el
+    # enunciado dentro de todo lo que se pasa)
+    f_codes, f_names = pd.factorize(pd.Series(file, dtype=object))
+    s_codes, s_names = pd.factorize(pd.Series(speaker, dtype=object))
+    p_codes, p_names = pd.factorize(pd.Series(mor_pos, dtype=object))
+    w_codes, w_names = pd.factorize(pd.Series(word, dtype="string").str.lower())
+    n_spk = max(len(s_names), 1)
+    group = f_codes.astype(np.int64) * n_spk + s_codes
+    n_groups = len(f_names) * n_spk
+    is_word = (p_codes >= 0) & (p_codes != (p_names.get_loc("PUNCT") if "PUNCT" in p_names else -1))
+    first = np.unique(np.asarray(utt)[is_word], return_index=True)[1]
+    has_form = is_word & (w_codes >= 0)
+    parts = [
+        _group_counts("tokens", group, n_groups),
+        _group_counts("mismatches", group, n_groups, weights=np.asarray(mismatch, dtype=np.int64)),
+        _group_counts("words", group[is_word], n_groups),
+        _group_counts("utterances", group[is_word][first], n_groups),
+        _group_counts("pos", group[is_word], n_groups, key=p_codes[is_word], key_names=p_names),
+        _group_counts("type", group[has_form], n_groups, key=w_codes[has_form], key_names=w_names),
+    ]
+    out = pd.concat(parts, ignore_index=True)
+    return pd.DataFrame({
+        "file": np.asarray(f_names, dtype=object)[out["g"] // n_spk],
+        "speaker": np.asarray(s_names, dtype=object)[out["g"] % n_spk],
+        "kind": out["kind"].to_numpy(object), "key": out["key"].to_numpy(object),
+        "n": out["n"].to_numpy(np.int64),
+    }, columns=list(COUNT_COLUMNS))
+
+def partial_counts(data: pd.DataFrame | TokenColumns) -> pd.DataFrame:
+    # Conteos por (file, speaker) de una tabla de tokens ancha (o de una parte de ella) o
+    # directamente de un TokenColumns (sin armar la tabla)
+    if isinstance(data, TokenColumns):
+        utt = data._per_token(np.arange(data.n_utterances(), dtype=np.int64))
+        return _counts(data.column("file"), data.column("speaker"), utt, data.column("mor_pos"),
+                       data.word, np.array(data.diag_mismatch, dtype=bool))
+    utt = data.groupby(["file", "utt_index"], observed=True, sort=False).ngroup().to_numpy()
+    return _counts(data["file"], data["speaker"], utt, data["mor_pos"], data["word"], data["diag_mismatch"])
+
+def metrics_from_counts(counts: pd.DataFrame, by: Sequence[str] = ("speaker",)) -> pd.DataFrame:
+    # METRIC_COLUMNS agrupando los conteos por by (p. ej. ("speaker",) o ("file", "speaker"))
+    by = list(by)
+    scalar = (counts[counts["kind"].isin(_SCALAR_KINDS)]
+              .pivot_table(index=by, columns="kind", values="n", aggfunc="sum", fill_value=0)
+              .reindex(columns=list(_SCALAR_KINDS), fill_value=0))
+    types = counts[counts["kind"] == "type"].groupby(by)["key"].nunique()
+    out = pd.DataFrame(index=scalar.index)
+    out["n_utterances"] = scalar["utterances"]
+    out["n_words"] = scalar["words"]
+    out["mlu"] = scalar["words"] / scalar["utterances"].where(scalar["utterances"] > 0)
+    out["n_types"] = types.reindex(scalar.index, fill_value=0)
+    out["ttr"] = out["n_types"] / scalar["words"].where(scalar["words"] > 0)
+    out["n_tokens"] = scalar["tokens"]
+    out["n_mismatches"] = scalar["mismatches"]
+    out["mismatch_rate"] = scalar["mismatches"] / scalar["tokens"].where(scalar["tokens"] > 0)
+    return out.reset_index()
+
+def pos_distribution_from_counts(counts: pd.DataFrame, by: Sequence[str] = ("speaker",)) -> pd.DataFrame:
+    # Proporción de cada mor_pos entre las palabras de cada grupo (una columna por categoría)
+    pos = counts[counts["kind"] == "pos"].pivot_table(index=list(by), columns="key", values="n",
+                                                       aggfunc="sum", fill_value=0)
+    pos.columns.name = None
+    return pos.div(pos.sum(axis=1), axis=0).reset_index()
+
+class MetricsStore:
+    def __init__(self, folder: str | Path, recursive: bool = False, path: str | Path | None = None):
+        self.folder = Path(folder)
+        self.recursive = recursive
+        self.path = Path(path) if path else self.folder / METRICS_NAME
+        try:
+            self.con = sqlite3.connect(self.path)
+            version = self.con.execute("PRAGMA user_version").fetchone()[0]
+        except sqlite3.DatabaseError:
+            self.con.close(); self.path.unlink(missing_ok=True)
+            self.con = sqlite3.connect(self.path); version = None
+        # Los conteos dependen de lo que produce el parser: si cambia, se rehacen
+        if version != METRICS_VERSION * 1000 + PARSER_VERSION:
+            self.con.executescript(f"""
+                DROP TABLE IF EXISTS files;
+                DROP TABLE IF EXISTS counts;
+                CREATE TABLE files (file_id INTEGER PRIMARY KEY, rel TEXT UNIQUE, size INTEGER,
+                                    mtime_ns INTEGER, sha256 TEXT);
+                CREATE TABLE counts (file_id INTEGER, speaker TEXT, kind TEXT, key TEXT, n INTEGER);
+                CREATE INDEX counts_file ON counts (file_id);
+                PRAGMA user_version = {METRICS_VERSION * 1000 + PARSER_VERSION};
+            """)
+
+    def close(self):
+        self.con.commit()
+        self.con.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def update(self, workers: int | None = 1, cache: bool | str | Path | None = None) -> Dict[str, int]:
+        # Rehace los conteos de los archivos nuevos o cambiados y quita los de los que ya
+        # no están (ver CorpusIndex.update)
+        todo, removed, unchanged = _scan_files(self.con, self.folder, self.recursive)
+        stats = {"added": 0, "updated": 0, "removed": len(removed), "unchanged": unchanged}
+        for fid in removed:
+            self.con.execute("DELETE FROM counts WHERE file_id = ?", (fid,))
+            self.con.execute("DELETE FROM files WHERE file_id = ?", (fid,))
+        parsed = _iter_parsed([t[0] for t in todo], workers=workers, cache=cache)
+        for (f, rel, st, digest, fid), (cols, _) in zip(todo, parsed):
+            if fid is not None:
+                self.con.execute("DELETE FROM counts WHERE file_id = ?", (fid,))
+                stats["updated"] += 1
+            else:
+                fid = self.con.execute("INSERT INTO files (rel) VALUES (?)", (rel,)).lastrowid
+                stats["added"] += 1
+            self.con.execute("UPDATE files SET size = ?, mtime_ns = ?, sha256 = ? WHERE file_id = ?",
+                             (st.st_size, st.st_mtime_ns, digest, fid))
+            counts = partial_counts(cols)
+            self.con.executemany("INSERT INTO counts VALUES (?, ?, ?, ?, ?)",
+                                 zip([fid] * len(counts), counts["speaker"], counts["kind"], counts["key"],
+                                     counts["n"].tolist()))
+            self.con.commit()
+        return stats
+
+    def counts(self, per_file: bool = False) -> pd.DataFrame:
+        # Conteos sumados por hablante (y archivo, con per_file) hechos en SQLite
+        if per_file:
+            sql = ("SELECT rel AS file, speaker, kind, key, SUM(n) AS n FROM counts JOIN files USING (file_id)"
+                   " GROUP BY rel, speaker, kind, key")
+        else:
+            sql = "SELECT '' AS file, speaker, kind, key, SUM(n) AS n FROM counts GROUP BY speaker, kind, key"
+        return pd.DataFrame(self.con.execute(sql).fetchall(), columns=list(COUNT_COLUMNS))
+
+    def speaker_metrics(self) -> pd.DataFrame:
+        return metrics_from_counts(self.counts(), by=("speaker",))
+
+    def file_metrics(self) -> pd.DataFrame:
+        return metrics_from_counts(self.counts(per_file=True), by=("file", "speaker"))
+
+    def pos_distribution(self, per_file: bool = False) -> pd.DataFrame:
+        by = ("file", "speaker") if per_file else ("speaker",)
+        return pos_distribution_from_counts(self.counts(per_file), by=by)
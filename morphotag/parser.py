@@ -1,7 +1,16 @@
+from array import array
 from pathlib import Path
-import re
+from urllib.parse import quote
+import hashlib, os, pickle, re, shutil, uuid
+from functools import partial
 from typing import List, Dict, Tuple, Optional
+import numpy as np
 import pandas as pd
+from .utils import map_ordered, write_bytes_atomic
+from .cache import ShardCache, shard_path, DEFAULT_MAX_BYTES
+
+# Súbelo cuando cambie lo que produce el parser: invalida la caché de análisis
+PARSER_VERSION = 2
 
 MAIN_HDR_RE = re.compile(r'^\s*\*([A-Za-z0-9]{1,7})\s*:\s*(.*)$')
 MOR_RE      = re.compile(r'^\s*%mor\s*:\s*(.+)$', re.IGNORECASE)
@@ -47,11 +56,238 @@ def _next_mor_gra(lines: List[str], start_idx: int):
         break
     return mor_tokens, gra_map, j
 
-def parse_chat_tolerant_to_rows(cha_path: str | Path):
+TOKEN_COLUMNS = ("file", "utt_index", "token_index", "speaker", "word", "mor_pos", "mor_rest",
+                 "head_index", "deprel", "diag_mismatch", "utterance_text")
+CATEGORY_COLUMNS = ("file", "speaker", "mor_pos", "deprel")
+# Forma normalizada: un enunciado por fila y tokens que lo referencian por utt_id
+UTTERANCE_COLUMNS = ("utt_id", "file", "utt_index", "speaker", "utterance_text")
+TOKEN_TABLE_COLUMNS = ("utt_id", "token_index", "word", "mor_pos", "mor_rest", "head_index", "deprel", "diag_mismatch")
+_UTT_LEVEL = ("file", "speaker", "utt_index", "utterance_text")
+
+def _small_int_dtype(values: np.ndarray):
+    hi = int(values.max(initial=0)); lo = int(values.min(initial=0))
+    # desde int16: con int8 cualquier suma (p. ej. token_index + 100) desborda
+    for dt in (np.int16, np.int32):
+        info = np.iinfo(dt)
+        if info.min <= lo and hi <= info.max:
+            return dt
+    return np.int64
+
+class TokenColumns:
+    # Tabla de tokens por columnas: en vez de un dict por token, cada columna se va
+    # llenando por separado. file/speaker/utt_index/utterance_text se guardan una vez por
+    # enunciado (con su número de tokens) y sólo se repiten al pedir la tabla ancha.
+    # file/speaker/mor_pos/deprel se guardan ya como códigos de categoría (array de int32 +
+    # diccionario valor→código); los índices como array de enteros (head_index con
+    # máscara de nulos).
+    def __init__(self):
+        self.codes = {c: array("i") for c in CATEGORY_COLUMNS}
+        self.categories = {c: {} for c in CATEGORY_COLUMNS}
+        # por enunciado (también los que no tienen tokens)
+        self.utt_index = array("q"); self.n_tokens = array("q"); self.utterance_text = []
+        # por token
+        self.token_index = array("q")
+        self.head_index = array("q"); self.head_missing = array("b")
+        self.diag_mismatch = array("b")
+        self.word = []; self.mor_rest = []
+
+    def code(self, column: str, value) -> int:
+        if value is None:
+            return -1
+        cats = self.categories[column]
+        code = cats.get(value)
+        if code is None:
+            code = cats[value] = len(cats)
+        return code
+
+    def __len__(self):
+        return len(self.token_index)
+
+    def n_utterances(self) -> int:
+        return len(self.utt_index)
+
+    def fresh(self) -> "TokenColumns":
+        # Tabla vacía que comparte (y sigue ampliando) las categorías de ésta: los códigos
+        # de un trozo a otro son estables y cada diccionario sólo crece por el final
+        new = TokenColumns()
+        new.categories = self.categories
+        return new
+
+    def extend(self, other: "TokenColumns"):
+        # Añade otra tabla, traduciendo sus códigos de categoría a los de ésta
+        for c in CATEGORY_COLUMNS:
+            # el último hueco es para -1 (nulo)
+            remap = np.array([self.code(c, v) for v in other.categories[c]] + [-1], dtype=np.int32)
+            if len(other.codes[c]):
+                self.codes[c].frombytes(remap[np.frombuffer(other.codes[c], dtype=np.int32)].tobytes())
+        for name in ("utt_index", "n_tokens", "utterance_text", "token_index", "head_index", "head_missing",
+                     "diag_mismatch", "word", "mor_rest"):
+            getattr(self, name).extend(getattr(other, name))
+
+    def _per_token(self, values):
+        # valor de cada enunciado repetido para cada uno de sus tokens
+        return np.repeat(values, np.array(self.n_tokens, dtype=np.int64))
+
+    def column(self, name: str, int_dtype=None, per_utterance: bool = False):
+        # per_utterance: file/speaker/utt_index/utterance_text una vez por enunciado
+        expand = name in _UTT_LEVEL and not per_utterance
+        if name in CATEGORY_COLUMNS:
+            cats = self.categories[name]
+            codes = np.frombuffer(self.codes[name], dtype=np.int32) if len(self.codes[name]) else np.empty(0, np.int32)
+            if expand:
+                codes = self._per_token(codes)
+            return pd.Categorical.from_codes(codes, categories=pd.Index(list(cats), dtype=object))
+        if name in ("utt_index", "token_index", "head_index"):
+            values = np.array(getattr(self, name), dtype=np.int64)
+            if expand:
+                values = self._per_token(values)
+            if name != "head_index":
+                return values.astype(int_dtype or _small_int_dtype(values))
+            mask = np.array(self.head_missing, dtype=bool)
+            values = values.astype(int_dtype or _small_int_dtype(values[~mask]))
+            return pd.arrays.IntegerArray(values, mask)
+        if name == "diag_mismatch":
+            return np.array(self.diag_mismatch, dtype=bool)
+        values = ([t for t, n in zip(self.utterance_text, self.n_tokens) for _ in range(n)] if expand
+                  else getattr(self, name))
+        # vacía: object explícito (una lista vacía sería float64 en el DataFrame)
+        return values if len(values) else np.empty(0, dtype=object)
+
+    def gra_csr(self) -> Tuple[np.ndarray, np.ndarray]:
+        # %gra en forma CSR: heads (0 = raíz, -1 = el token no está en %gra) y offsets; los
+        # tokens del enunciado u son heads[offsets[u]:offsets[u + 1]], en el orden de %mor.
+        # Ver morphotag.deptree para las métricas sobre estos arrays.
+        offsets = np.zeros(self.n_utterances() + 1, dtype=np.int64)
+        np.cumsum(np.array(self.n_tokens, dtype=np.int64), out=offsets[1:])
+        pos = np.arange(len(self), dtype=np.int64) - self._per_token(offsets[:-1]) + 1
+        if not np.array_equal(pos, np.array(self.token_index, dtype=np.int64)):
+            raise ValueError("Faltan tokens en algún enunciado (¿filtros de token?): no se puede armar el árbol")
+        heads = np.array(self.head_index, dtype=np.int64)
+        heads[np.array(self.head_missing, dtype=bool)] = -1
+        return heads, offsets
+
+    def to_frame(self, int_dtype=None, columns=TOKEN_COLUMNS) -> pd.DataFrame:
+        # Tabla ancha: un token por fila con todo lo de su enunciado.
+        # int_dtype: fija el tipo de los índices (si no, el menor que quepa)
+        return pd.DataFrame({c: self.column(c, int_dtype) for c in columns})
+
+    def to_tables(self, int_dtype=None, first_utt_id: int = 0) -> Tuple[pd.DataFrame, pd.DataFrame]:
+        # (utterances, tokens) unidas por utt_id (first_utt_id, first_utt_id + 1, ...);
+        # ver widen_tokens para volver a la tabla ancha
+        ids = np.arange(first_utt_id, first_utt_id + self.n_utterances(), dtype=np.int64)
+        id_dtype = int_dtype or (np.int32 if first_utt_id + len(ids) <= np.iinfo(np.int32).max else np.int64)
+        utts = {"utt_id": ids.astype(id_dtype)}
+        utts.update({c: self.column(c, int_dtype, per_utterance=True) for c in UTTERANCE_COLUMNS[1:]})
+        toks = {"utt_id": self._per_token(ids).astype(id_dtype)}
+        toks.update({c: self.column(c, int_dtype) for c in TOKEN_TABLE_COLUMNS[1:]})
+        return pd.DataFrame(utts), pd.DataFrame(toks)
+
+    def to_rows(self) -> List[dict]:
+        cats = {c: list(self.categories[c]) for c in CATEGORY_COLUMNS}
+        decode = lambda c, k: cats[c][k] if k >= 0 else None
+        rows = []; start = 0
+        for u, n in enumerate(self.n_tokens):
+            shared = {"file": decode("file", self.codes["file"][u]), "utt_index": self.utt_index[u],
+                      "speaker": decode("speaker", self.codes["speaker"][u]),
+                      "utterance_text": self.utterance_text[u]}
+            for t in range(start, start + n):
+                row = {}
+                for c in TOKEN_COLUMNS:
+                    if c in shared:
+                        row[c] = shared[c]
+                    elif c in CATEGORY_COLUMNS:
+                        row[c] = decode(c, self.codes[c][t])
+                    elif c == "head_index":
+                        row[c] = None if self.head_missing[t] else self.head_index[t]
+                    elif c == "diag_mismatch":
+                        row[c] = bool(self.diag_mismatch[t])
+                    else:
+                        row[c] = getattr(self, c)[t]
+                rows.append(row)
+            start += n
+        return rows
+
+def widen_tokens(utterances: pd.DataFrame, tokens: pd.DataFrame) -> pd.DataFrame:
+    # La tabla ancha de siempre (TOKEN_COLUMNS) a partir de las dos normalizadas
+    return tokens.merge(utterances, on="utt_id", how="left", sort=False)[list(TOKEN_COLUMNS)]
+
+# ---------- rasgos de %mor ----------
+# mor_rest (lo que sigue a 'pos|') descompuesto en columnas:
+#   lemma     raíz sin prefijos ('un#'), sufijos ni rasgos; los compuestos quedan 'sun+flower'
+#   suffixes  sufijos separados por '-' ('PL', 'PAST-3S')
+#   fusional  rasgos fusionales separados por '&' ('PRES&3S')
+#   clitic_of lo que va pegado tras '~' ('v|be&PRES'), el clítico de este token
+# Se hace con operaciones de texto de pandas sobre los valores distintos de la columna
+# (muchos menos que tokens) y luego se reparte a cada token por su código.
+MOR_FEATURE_COLUMNS = ("lemma", "suffixes", "fusional", "clitic_of")
+_MOR_STEM_FEATS_RE = r'^(?P<lemma>[^-&=]*)(?P<feats>[^=]*)'
+
+def _none_if_empty(s: pd.Series) -> np.ndarray:
+    values = s.to_numpy(object)
+    return np.where(s.notna().to_numpy() & (values != ""), values, None)
+
+def mor_features(mor_rest) -> pd.DataFrame:
+    index = mor_rest.index if isinstance(mor_rest, pd.Series) else None
+    codes, uniq = pd.factorize(pd.Series(mor_rest, dtype=object), use_na_sentinel=True)
+    if not len(uniq):
+        # sin ningún %mor (o tabla vacía): partition no daría columnas
+        return pd.DataFrame({c: np.full(len(codes), None, dtype=object) for c in MOR_FEATURE_COLUMNS}, index=index)
+    s = pd.Series(uniq, dtype=object)
+    parts = s.str.partition("~")
+    main = (parts[0].str.replace(r'^(?:[^#|+]*#)+', '', regex=True)
+                    .str.replace(r'\+[^+|]*\|', '+', regex=True).str.lstrip("+"))
+    split = main.str.extract(_MOR_STEM_FEATS_RE)
+    feats = split["feats"]
+    found = {
+        "lemma": split["lemma"],
+        "suffixes": feats.str.replace(r'&[^-&]*', '', regex=True).str.strip("-"),
+        "fusional": feats.str.replace(r'-[^-&]*', '', regex=True).str.strip("&"),
+        "clitic_of": parts[2],
+    }
+    # El código -1 (sin %mor) cae en el None añadido al final
+    return pd.DataFrame({c: np.append(_none_if_empty(v), None)[codes]
+                         for c, v in found.items()}, index=index)
+
+def add_mor_features(df: pd.DataFrame) -> pd.DataFrame:
+    # La tabla de tokens (ancha o normalizada) con MOR_FEATURE_COLUMNS tras mor_rest
+    feats = mor_features(df["mor_rest"])
+    at = df.columns.get_loc("mor_rest") + 1
+    cols = list(df.columns)
+    return pd.concat([df, feats], axis=1)[cols[:at] + list(MOR_FEATURE_COLUMNS) + cols[at:]]
+
+def _skip_dependents(lines: List[str], start_idx: int) -> int:
+    # Donde acabaría _next_mor_gra, pero sin partir %mor ni %gra
+    j = start_idx + 1
+    while j < len(lines):
+        ln = lines[j]
+        if ln.strip() and not DEP_ANY_RE.match(ln):
+            break
+        j += 1
+    return j
+
+UTTERANCE_LEVEL_COLUMNS = ("speaker", "utt_index", "utterance_text")
+
+def parse_chat_tolerant_to_columns(cha_path: str | Path, out: Optional[TokenColumns] = None,
+                                   text: Optional[str] = None, where: Optional[Dict[str, object]] = None):
+    # Como parse_chat_tolerant_to_rows, pero llenando (o ampliando) un TokenColumns.
+    # text: el contenido ya leído (si no, se lee de cha_path)
+    # where: columna → función que dice si el valor pasa (ver morphotag.corpus). Los
+    # enunciados que no pasan por speaker/utt_index/utterance_text se saltan sin mirar sus
+    # tiers dependientes; con filtros de token sólo se guardan los tokens que pasan (y los
+    # enunciados que conservan alguno). Con where no se devuelven issues.
     cha_path = Path(cha_path)
-    text = cha_path.read_text(encoding="utf-8", errors="ignore")
+    cols = out if out is not None else TokenColumns()
+    if text is None:
+        text = cha_path.read_text(encoding="utf-8", errors="ignore")
+    where = where or {}
+    utt_where = [(c, p) for c, p in where.items() if c in UTTERANCE_LEVEL_COLUMNS]
+    tok_where = [(c, p) for c, p in where.items() if c not in UTTERANCE_LEVEL_COLUMNS and c != "file"]
     lines = text.splitlines()
-    rows = []; issues = []; utt_idx = 0; i = 0
+    issues = []; utt_idx = 0; i = 0
+    file_code = cols.code("file", cha_path.name)
+    c_file, c_speaker, c_pos, c_rel = (cols.codes[c] for c in CATEGORY_COLUMNS)
+    pos_code = lambda v: cols.code("mor_pos", v)
+    rel_code = lambda v: cols.code("deprel", v)
     while i < len(lines):
         ln = lines[i]
         m = MAIN_HDR_RE.match(ln)
@@ -60,6 +296,12 @@ def parse_chat_tolerant_to_rows(cha_path: str | Path):
         utt_idx += 1
         speaker = m.group(1)
         main_text = m.group(2).strip()
+        if utt_where:
+            utt = {"speaker": speaker, "utt_index": utt_idx, "utterance_text": main_text}
+            if not all(p(utt[c]) for c, p in utt_where):
+                stop = _skip_dependents(lines, i)
+                i = stop if stop > i else i + 1
+                continue
         mor_tokens, gra_map, stop = _next_mor_gra(lines, i)
         if mor_tokens is None:
             issues.append({"utt_index": utt_idx, "reason": "sin_%mor"}); mor_tokens = []
@@ -69,35 +311,277 @@ def parse_chat_tolerant_to_rows(cha_path: str | Path):
         N = max(n_mor, max_gra_idx)
         if n_mor != max_gra_idx and not (n_mor == 0 and max_gra_idx == 0):
             issues.append({"utt_index": utt_idx, "reason": f"desajuste_mor({n_mor})_gra({max_gra_idx})"})
+        kept = N
+        if not tok_where:
+            cols.token_index.extend(range(1, N + 1))
+        else:
+            kept = 0
         for k in range(1, N + 1):
             mor_tok = mor_tokens[k-1] if k-1 < n_mor else None
             mor_pos, mor_rest, stem = _split_mor_token(mor_tok)
             g_head, g_rel = gra_map.get(k, (None, None))
-            rows.append({
-                "file": cha_path.name,
-                "utt_index": utt_idx,
-                "token_index": k,
-                "speaker": speaker,
-                "word": stem,
-                "mor_pos": mor_pos,
-                "mor_rest": mor_rest,
-                "head_index": g_head,
-                "deprel": g_rel,
-                "diag_mismatch": (k > n_mor) or (k not in gra_map),
-                "utterance_text": main_text,
-            })
+            mismatch = (k > n_mor) or (k not in gra_map)
+            if tok_where:
+                tok = {"token_index": k, "word": stem, "mor_pos": mor_pos, "mor_rest": mor_rest,
+                       "head_index": g_head, "deprel": g_rel, "diag_mismatch": mismatch}
+                if not all(p(tok[c]) for c, p in tok_where):
+                    continue
+                cols.token_index.append(k); kept += 1
+            cols.word.append(stem); cols.mor_rest.append(mor_rest)
+            c_pos.append(pos_code(mor_pos)); c_rel.append(rel_code(g_rel))
+            cols.head_index.append(g_head if g_head is not None else 0); cols.head_missing.append(g_head is None)
+            cols.diag_mismatch.append(mismatch)
+        if kept or not tok_where:
+            c_file.append(file_code); c_speaker.append(cols.code("speaker", speaker))
+            cols.utt_index.append(utt_idx); cols.utterance_text.append(main_text); cols.n_tokens.append(kept)
         i = stop if stop > i else i + 1
-    return rows, issues
-
-def build_df_from_dir_without_pylangacq(folder: str | Path, recursive: bool = False):
-    folder = Path(folder)
-    pattern = "**/*.cha" if recursive else "*.cha"
-    all_rows = []; all_issues = []
-    for f in sorted(folder.glob(pattern)):
-        rows, issues = parse_chat_tolerant_to_rows(f)
-        all_rows.extend(rows)
+    return cols, (issues if not where else [])
+
+def parse_chat_tolerant_to_rows(cha_path: str | Path):
+    cols, issues = parse_chat_tolerant_to_columns(cha_path)
+    return cols.to_rows(), issues
+
+def _parse_file(f: Path, where: Optional[Dict[str, object]] = None):
+    cols, issues = parse_chat_tolerant_to_columns(f, where=where)
+    for it in issues: it["file"] = f.name
+    return cols, issues
+
+def _load_shard(shard: Path, f: Path):
+    try:
+        cols, issues = pickle.loads(shard.read_bytes())
+    except Exception:
+        return None
+    # el mismo contenido pudo analizarse con otro nombre de archivo
+    cols.categories["file"] = {f.name: 0}
+    for it in issues: it["file"] = f.name
+    return cols, issues
+
+def _parse_file_cached(item, shard_dir: Path):
+    # Trabajo de cada proceso con caché: item = (archivo, sha256 si el índice ya lo
+    # conoce por ruta/tamaño/mtime). El archivo se lee una sola vez para hash y análisis.
+    f, digest = item
+    st = f.stat()
+    if digest is not None:
+        loaded = _load_shard(shard_path(shard_dir, digest), f)
+        if loaded is not None:
+            return *loaded, digest, st.st_size, st.st_mtime_ns
+    raw = f.read_bytes()
+    digest = hashlib.sha256(raw).hexdigest()
+    shard = shard_path(shard_dir, digest)
+    loaded = _load_shard(shard, f) if shard.exists() else None
+    if loaded is None:
+        cols, issues = parse_chat_tolerant_to_columns(f, text=raw.decode("utf-8", errors="ignore"))
+        write_bytes_atomic(shard, pickle.dumps((cols, issues), protocol=pickle.HIGHEST_PROTOCOL))
         for it in issues: it["file"] = f.name
+        loaded = cols, issues
+    return *loaded, digest, st.st_size, st.st_mtime_ns
+
+def _iter_parsed(files: List[Path], workers: int | None = 1, cache: bool | str | Path | None = None,
+                 cache_max_bytes: int | None = DEFAULT_MAX_BYTES):
+    # (TokenColumns, issues) de cada archivo, en orden. Los archivos se analizan por
+    # separado (en paralelo con workers > 1). cache: True (carpeta por defecto, ver
+    # morphotag.cache) o una carpeta → los archivos sin cambios se cargan del análisis
+    # guardado en lugar de volver a analizarse.
+    if not cache:
+        yield from map_ordered(_parse_file, files, workers=workers)
+        return
+    pc = ShardCache("parse", PARSER_VERSION, directory=None if cache is True else cache,
+                    max_bytes=cache_max_bytes)
+    try:
+        items = [(f, pc.known_digest(f)) for f in files]
+        results = map_ordered(partial(_parse_file_cached, shard_dir=pc.dir), items, workers=workers)
+        for f, (file_cols, issues, digest, size, mtime_ns) in zip(files, results):
+            pc.record(f, size, mtime_ns, digest)
+            yield file_cols, issues
+        pc.evict()
+    finally:
+        pc.close()
+
+def _cha_files(folder: str | Path, recursive: bool) -> List[Path]:
+    return sorted(Path(folder).glob("**/*.cha" if recursive else "*.cha"))
+
+def build_df_from_dir_without_pylangacq(folder: str | Path, recursive: bool = False, workers: int | None = 1,
+                                        cache: bool | str | Path | None = None,
+                                        cache_max_bytes: int | None = DEFAULT_MAX_BYTES):
+    # Se une todo una sola vez; el orden es siempre el de los archivos ordenados por ruta
+    cols = TokenColumns(); all_issues = []
+    for file_cols, issues in _iter_parsed(_cha_files(folder, recursive), workers, cache, cache_max_bytes):
+        cols.extend(file_cols)
         all_issues.extend(issues)
-    df = pd.DataFrame(all_rows)
+    df = cols.to_frame()
     df_issues = pd.DataFrame(all_issues)
     return df, df_issues
+
+def build_tables_from_dir(folder: str | Path, recursive: bool = False, workers: int | None = 1,
+                          cache: bool | str | Path | None = None,
+                          cache_max_bytes: int | None = DEFAULT_MAX_BYTES):
+    # Como build_df_from_dir_without_pylangacq, en forma normalizada:
+    # (utterances, tokens, issues); widen_tokens(utterances, tokens) da la tabla ancha
+    cols = TokenColumns(); all_issues = []
+    for file_cols, issues in _iter_parsed(_cha_files(folder, recursive), workers, cache, cache_max_bytes):
+        cols.extend(file_cols)
+        all_issues.extend(issues)
+    utterances, tokens = cols.to_tables()
+    return utterances, tokens, pd.DataFrame(all_issues)
+
+ISSUE_COLUMNS = ("utt_index", "reason", "file")
+
+def _iter_chunks(folder, recursive, workers, cache, cache_max_bytes, chunk_rows):
+    # (TokenColumns, issues) de uno o varios archivos seguidos, con categorías compartidas
+    cols = TokenColumns(); buf = []
+    for file_cols, issues in _iter_parsed(_cha_files(folder, recursive), workers, cache, cache_max_bytes):
+        cols.extend(file_cols); buf.extend(issues)
+        if not chunk_rows or len(cols) >= chunk_rows:
+            yield cols, buf
+            cols = cols.fresh(); buf = []
+    if cols.n_utterances() or buf:
+        yield cols, buf
+
+def iter_token_frames(folder: str | Path, recursive: bool = False, workers: int | None = 1,
+                      cache: bool | str | Path | None = None,
+                      cache_max_bytes: int | None = DEFAULT_MAX_BYTES,
+                      chunk_rows: Optional[int] = None):
+    # Como build_df_from_dir_without_pylangacq, pero por trozos (tokens, issues): uno por
+    # archivo o, con chunk_rows, cada vez que se juntan al menos chunk_rows tokens (un
+    # archivo nunca se parte). La memoria depende del trozo, no del corpus. Los índices
+    # son siempre int32, las columnas de issues fijas y las categorías acumuladas, para
+    # que todos los trozos tengan el mismo esquema al ir añadiéndolos a un archivo (ver
+    # TableWriter).
+    for cols, issues in _iter_chunks(folder, recursive, workers, cache, cache_max_bytes, chunk_rows):
+        yield cols.to_frame(int_dtype=np.int32), _issues_frame(issues)
+
+def iter_token_tables(folder: str | Path, recursive: bool = False, workers: int | None = 1,
+                      cache: bool | str | Path | None = None,
+                      cache_max_bytes: int | None = DEFAULT_MAX_BYTES,
+                      chunk_rows: Optional[int] = None):
+    # iter_token_frames en forma normalizada: (utterances, tokens, issues) por trozo, con
+    # utt_id únicos en todo el corpus
+    next_id = 0
+    for cols, issues in _iter_chunks(folder, recursive, workers, cache, cache_max_bytes, chunk_rows):
+        utterances, tokens = cols.to_tables(int_dtype=np.int32, first_utt_id=next_id)
+        next_id += cols.n_utterances()
+        yield utterances, tokens, _issues_frame(issues)
+
+def _issues_frame(issues: List[dict]) -> pd.DataFrame:
+    return pd.DataFrame(issues, columns=list(ISSUE_COLUMNS)).astype({"utt_index": np.int64})
+
+# ---------- escritura de tablas ----------
+TABLE_FORMATS = {"csv": ".csv", "parquet": ".parquet", "feather": ".feather"}
+
+# Columnas de texto: siempre string en Arrow, aunque en el primer trozo sólo haya nulos
+_TEXT_COLUMNS = ("word", "mor_rest", "utterance_text", "reason", *MOR_FEATURE_COLUMNS)
+
+def _arrow_schema(table):
+    # El esquema del primer trozo, sin tipos 'null' (columnas que en ese trozo sólo
+    # tenían nulos) ni índices de categoría estrechos: los trozos siguientes pueden
+    # traer texto o más categorías
+    import pyarrow as pa
+    fields = []
+    for field in table.schema:
+        t = field.type
+        if pa.types.is_null(t) or (field.name in _TEXT_COLUMNS and not pa.types.is_dictionary(t)):
+            t = pa.string()
+        elif pa.types.is_dictionary(t):
+            # los códigos de categoría pueden crecer de un trozo a otro
+            t = pa.dictionary(pa.int32(), pa.string() if pa.types.is_null(t.value_type) else t.value_type)
+        fields.append(field.with_type(t))
+    return pa.schema(fields, metadata=table.schema.metadata)
+
+class TableWriter:
+    # Escribe una tabla por trozos (write) sin tenerla entera en memoria: CSV añadiendo
+    # filas, parquet como un row group por trozo y feather como lotes de Arrow IPC
+    # (parquet y feather necesitan pyarrow, que se importa sólo al usarlos). Con
+    # partition_by la salida es una carpeta estilo Hive: <path>/<col>=<valor>/part-<n>.<ext>,
+    # un archivo por trozo y valor, sin la columna dentro (pyarrow.dataset y
+    # pandas.read_parquet la recuperan del nombre). Todo va a un temporal junto a path
+    # que sólo reemplaza a path al cerrar sin errores.
+    def __init__(self, path: str | Path, fmt: str = "csv", partition_by: Optional[str] = None):
+        if fmt not in TABLE_FORMATS:
+            raise ValueError(f"Formato no soportado: {fmt!r} (usa {', '.join(TABLE_FORMATS)})")
+        self.path = Path(path); self.fmt = fmt; self.partition_by = partition_by
+        self.tmp = self.path.parent / f".{self.path.name}.{uuid.uuid4().hex}.tmp"
+        if partition_by:
+            self.tmp.mkdir(parents=True)
+        self._writer = None; self._schema = None; self._chunks = 0; self._empty = None
+
+    def _arrow(self, df: pd.DataFrame):
+        # Todos los trozos (y partes) con el esquema del primero
+        import pyarrow as pa
+        if self._schema is None:
+            self._schema = _arrow_schema(pa.Table.from_pandas(df, preserve_index=False))
+        return pa.Table.from_pandas(df, schema=self._schema, preserve_index=False)
+
+    def _write_part(self, df: pd.DataFrame, path: Path):
+        if self.fmt == "csv":
+            df.to_csv(path, index=False, encoding="utf-8")
+        elif self.fmt == "parquet":
+            import pyarrow.parquet as pq
+            pq.write_table(self._arrow(df), path)
+        else:
+            import pyarrow.feather as feather
+            feather.write_feather(self._arrow(df), path)
+
+    def write(self, df: pd.DataFrame):
+        # Un trozo vacío no escribe nada ni fija el esquema; sólo se usa si no llega otro
+        if not len(df):
+            self._empty = df; return
+        self._write(df)
+
+    def _write(self, df: pd.DataFrame):
+        if self.partition_by:
+            for value, part in df.groupby(self.partition_by, observed=True, sort=True, dropna=False):
+                value = value[0] if isinstance(value, tuple) else value
+                name = "__HIVE_DEFAULT_PARTITION__" if pd.isna(value) else quote(str(value), safe="")
+                part_dir = self.tmp / f"{self.partition_by}={name}"
+                part_dir.mkdir(exist_ok=True)
+                self._write_part(part.drop(columns=[self.partition_by]),
+                                 part_dir / f"part-{self._chunks}{TABLE_FORMATS[self.fmt]}")
+        elif self.fmt == "csv":
+            df.to_csv(self.tmp, mode="a" if self._chunks else "w", header=not self._chunks,
+                      index=False, encoding="utf-8")
+        else:
+            table = self._arrow(df)
+            if self._writer is None:
+                import pyarrow as pa
+                if self.fmt == "parquet":
+                    import pyarrow.parquet as pq
+                    self._writer = pq.ParquetWriter(self.tmp, self._schema)
+                else:
+                    # feather admite un diccionario por columna que sólo crece (deltas)
+                    self._writer = pa.ipc.new_file(str(self.tmp), self._schema,
+                                                   options=pa.ipc.IpcWriteOptions(emit_dictionary_deltas=True))
+            self._writer.write_table(table)
+        self._chunks += 1
+
+    def close(self) -> Path:
+        if not self._chunks and not self.partition_by:
+            self._write(self._empty if self._empty is not None else pd.DataFrame())
+        if self._writer is not None:
+            self._writer.close(); self._writer = None
+        if self.partition_by and self.path.is_dir():
+            shutil.rmtree(self.path)
+        os.replace(self.tmp, self.path)
+        return self.path
+
+    def abort(self):
+        if self._writer is not None:
+            self._writer.close(); self._writer = None
+        if self.tmp.is_dir():
+            shutil.rmtree(self.tmp, ignore_errors=True)
+        else:
+            self.tmp.unlink(missing_ok=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+def write_table(df: pd.DataFrame, path: str | Path, fmt: str = "csv", partition_by: Optional[str] = None) -> Path:
+    # De una vez; ver TableWriter
+    with TableWriter(path, fmt, partition_by) as w:
+        w.write(df)
+    return w.path
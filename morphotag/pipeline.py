@@ -0,0 +1,107 @@
+import os
+from functools import partial
+from pathlib import Path
+from typing import Optional
+import numpy as np
+import pandas as pd
+from .clean import CLEAN_DIR_NAME, REVIEW_DIR_NAME, clean_text, _file_report
+from .parser import TokenColumns, parse_chat_tolerant_to_columns, _cha_files, _issues_frame
+from .utils import read_text_sniffed, stage_text, free_name, dir_names, map_ordered
+
+# ---------- limpieza + análisis en una pasada ----------
+# Lo mismo que process_dir_to_folders seguido de build_df_from_dir_without_pylangacq
+# sobre clean/, pero cada archivo se lee una sola vez: el texto limpio pasa al parser en
+# memoria. Por defecto no se escribe nada ni se tocan los originales; con out_dir el
+# texto limpio se guarda además en out_dir/clean/ o out_dir/needs_review/ con los
+# mismos nombres que daría process_dir_to_folders.
+# Como con clean/, sólo se analizan los archivos sin errores (include_review=True para
+# analizar todos). La columna file lleva el nombre original del archivo.
+
+def _clean_parse(path: Path, target_dirs: Optional[tuple[Path, Path]] = None, include_review: bool = False,
+                 **policy):
+    # Trabajo de cada proceso: leer, limpiar, (dejar el temporal) y analizar
+    original = read_text_sniffed(path)
+    text, rep = clean_text(original, **policy)
+    changed = text != original
+    staged = stage_text(target_dirs[0 if not rep["errors"] else 1], text) if target_dirs else None
+    if rep["errors"] and not include_review:
+        return changed, rep, staged, None, []
+    cols, issues = parse_chat_tolerant_to_columns(path, text=text)
+    for it in issues: it["file"] = path.name
+    return changed, rep, staged, cols, issues
+
+def _discard_staged(result):
+    if result[2] is not None:
+        result[2].unlink(missing_ok=True)
+
+def _iter_clean_chunks(input_dir: str | Path, recursive: bool = False, out_dir: str | Path | None = None,
+                       rename_on_change=True, include_review=False,
+                       allowed_dep_tiers=None, missing_hdr_policy="prefix_com", empty_hdr_policy="drop",
+                       workers: int | None = 1, chunk_rows: Optional[int] = None):
+    # (TokenColumns, issues, informes) por trozo, como _iter_chunks del parser
+    input_dir = Path(input_dir)
+    target_dirs = None
+    if out_dir is not None:
+        target_dirs = (Path(out_dir) / CLEAN_DIR_NAME, Path(out_dir) / REVIEW_DIR_NAME)
+        for d in target_dirs:
+            d.mkdir(parents=True, exist_ok=True)
+    files = [f for f in _cha_files(input_dir, recursive)
+             if not (target_dirs and any(d in f.parents for d in target_dirs))]
+    src_taken = {}
+    for f in files:
+        src_taken.setdefault(f.parent, set()).add(os.path.normcase(f.name))
+    taken = {d: dir_names(d) for d in target_dirs} if target_dirs else {}
+
+    work = partial(_clean_parse, target_dirs=target_dirs, include_review=include_review,
+                   allowed_dep_tiers=allowed_dep_tiers, missing_hdr_policy=missing_hdr_policy,
+                   empty_hdr_policy=empty_hdr_policy)
+    # temporales de resultados que no se llegan a colocar si se para antes (ver iter_process_dir)
+    results = map_ordered(work, files, workers=workers, discard=_discard_staged)
+    cols = TokenColumns(); buf = []; reps = []
+    try:
+        for f, (changed, rep, staged, file_cols, issues) in zip(files, results):
+            renamed = changed and rename_on_change
+            out_path = f
+            if staged is not None:
+                # nombres asignados aquí, en orden, como en iter_process_dir
+                target_dir = target_dirs[0 if not rep["errors"] else 1]
+                name = free_name(src_taken[f.parent], f"{f.stem}.fix", f.suffix) if renamed else f.name
+                out_path = target_dir / free_name(taken[target_dir], Path(name).stem, f.suffix)
+                taken[target_dir].add(os.path.normcase(out_path.name))
+                os.replace(staged, out_path)
+            reps.append(_file_report(f, rep, changed, out_path, renamed and staged is not None))
+            if file_cols is not None:
+                cols.extend(file_cols); buf.extend(issues)
+            if not chunk_rows or len(cols) >= chunk_rows:
+                yield cols, buf, reps
+                cols = cols.fresh(); buf = []; reps = []
+        if cols.n_utterances() or buf or reps:
+            yield cols, buf, reps
+    finally:
+        results.close()
+
+def clean_and_build_df(input_dir: str | Path, recursive: bool = False, out_dir: str | Path | None = None,
+                       workers: int | None = 1, **options):
+    # (tokens, issues, informes de limpieza); options: los de _iter_clean_chunks
+    cols = TokenColumns(); issues = []; reports = []
+    for chunk_cols, chunk_issues, chunk_reports in _iter_clean_chunks(input_dir, recursive, out_dir, workers=workers,
+                                                                      **options):
+        cols.extend(chunk_cols); issues.extend(chunk_issues); reports.extend(chunk_reports)
+    return cols.to_frame(), pd.DataFrame(issues), reports
+
+def iter_clean_token_frames(input_dir: str | Path, recursive: bool = False, out_dir: str | Path | None = None,
+                            workers: int | None = 1, chunk_rows: Optional[int] = None, **options):
+    # Como iter_token_frames: (tokens, issues, informes) por trozo
+    for cols, issues, reports in _iter_clean_chunks(input_dir, recursive, out_dir, workers=workers,
+                                                    chunk_rows=chunk_rows, **options):
+        yield cols.to_frame(int_dtype=np.int32), _issues_frame(issues), reports
+
+def iter_clean_token_tables(input_dir: str | Path, recursive: bool = False, out_dir: str | Path | None = None,
+                            workers: int | None = 1, chunk_rows: Optional[int] = None, **options):
+    # Como iter_token_tables: (utterances, tokens, issues, informes) por trozo
+    next_id = 0
+    for cols, issues, reports in _iter_clean_chunks(input_dir, recursive, out_dir, workers=workers,
+                                                    chunk_rows=chunk_rows, **options):
+        utterances, tokens = cols.to_tables(int_dtype=np.int32, first_utt_id=next_id)
+        next_id += cols.n_utterances()
+        yield utterances, tokens, _issues_frame(issues), reports
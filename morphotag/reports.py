@@ -0,0 +1,257 @@
+import json, sys
+from array import array
+from collections.abc import Mapping
+from pathlib import Path
+
+# ---------- informes compactos ----------
+# Los informes de limpieza son objetos con __slots__ que se ven como un dict (rep["ok"],
+# rep.get(...), dict(rep)); las listas de números de línea se guardan como tramos
+# consecutivos. Ocupan y se serializan (pickle entre procesos) mucho menos que los dict.
+
+class LineRanges:
+    # Secuencia de números de línea como tramos [inicio, inicio + n). Conserva el orden y
+    # las repeticiones de la lista original; se compara e imprime igual que ella.
+    # _runs: inicio, n, inicio, n, ... (None mientras está vacía)
+    __slots__ = ("_runs", "_len")
+
+    def __init__(self, lines=()):
+        self._runs = None; self._len = 0
+        for n in lines:
+            self.append(n)
+
+    def append(self, n: int):
+        runs = self._runs
+        if runs is None:
+            self._runs = array("I", (n, 1))
+        elif n == runs[-2] + runs[-1]:
+            runs[-1] += 1
+        else:
+            runs.append(n); runs.append(1)
+        self._len += 1
+
+    def _pairs(self):
+        runs = self._runs or ()
+        return zip(runs[::2], runs[1::2])
+
+    def ranges(self) -> list[tuple[int, int]]:
+        # [(primera, última), ...]
+        return [(s, s + c - 1) for s, c in self._pairs()]
+
+    def __len__(self):
+        return self._len
+
+    def __iter__(self):
+        for s, c in self._pairs():
+            yield from range(s, s + c)
+
+    def __eq__(self, other):
+        if isinstance(other, LineRanges):
+            return (self._runs or array("I")) == (other._runs or array("I"))
+        if isinstance(other, (list, tuple)):
+            return len(other) == self._len and list(self) == list(other)
+        return NotImplemented
+
+    def __reduce__(self):
+        # Al serializar: los tramos si ocupan menos que la lista, si no la lista (enteros
+        # pequeños, 2-3 bytes cada uno en pickle)
+        if not self._len:
+            return LineRanges, ()
+        if len(self._runs) < self._len:
+            return _line_ranges_from_runs, (self._runs.tolist(),)
+        return LineRanges, (list(self),)
+
+    __hash__ = None
+
+    def __repr__(self):
+        return repr(list(self))
+
+def _line_ranges_from_runs(runs: list) -> LineRanges:
+    lr = LineRanges()
+    if runs:
+        lr._runs = array("I", runs); lr._len = sum(runs[1::2])
+    return lr
+
+class CleanReport(Mapping):
+    # Lo que produce el motor de limpieza (clean_text)
+    _KEYS = ("tabs_fixed_count", "tabs_fixed_lines", "double_colon_fixed_lines", "double_colon_detected_lines",
+             "fixed_lines_prefix_com", "dropped_lines", "merged_orphan_lines", "dropped_initial_missing_header",
+             "initial_dep_removed", "sanitized_lines", "errors", "warnings", "end_changes")
+    _LINE_KEYS = ("tabs_fixed_lines", "double_colon_fixed_lines", "double_colon_detected_lines",
+                  "fixed_lines_prefix_com", "dropped_lines", "sanitized_lines")
+    __slots__ = _KEYS
+
+    def __init__(self, **values):
+        for key in self._KEYS:
+            setattr(self, key, LineRanges() if key in self._LINE_KEYS else None)
+        self.tabs_fixed_count = 0
+        self.merged_orphan_lines = []; self.errors = []; self.warnings = []
+        for key, value in values.items():
+            self[key] = value
+
+    def __getitem__(self, key):
+        if key not in self._KEYS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __setitem__(self, key, value):
+        if key not in self._KEYS:
+            raise KeyError(key)
+        if key in self._LINE_KEYS and not isinstance(value, LineRanges):
+            value = LineRanges(value)
+        setattr(self, key, value)
+
+    def __iter__(self):
+        return iter(self._KEYS)
+
+    def __len__(self):
+        return len(self._KEYS)
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.as_dict()!r})"
+
+    def as_dict(self) -> dict:
+        # Vista dict pura (listas en lugar de tramos), p. ej. para JSON
+        return {k: (list(v) if isinstance(v, LineRanges) else v) for k, v in self.items()}
+
+    @classmethod
+    def from_dict(cls, d: Mapping):
+        return cls(**{k: v for k, v in d.items() if k in cls._KEYS})
+
+    def __reduce__(self):
+        # Valores en el orden de _KEYS, sin repetir los nombres en cada informe
+        return _report_from_values, (type(self), tuple(getattr(self, k) for k in self._KEYS))
+
+def _report_from_values(cls, values: tuple) -> CleanReport:
+    rep = cls.__new__(cls)
+    for key, value in zip(cls._KEYS, values):
+        setattr(rep, key, value)
+    return rep
+
+class FileCleanReport(CleanReport):
+    # Informe de un archivo: el del motor más dónde quedó el resultado
+    _KEYS = ("file", "renamed_to", "changed", "ok", *CleanReport._KEYS, "output_path")
+    __slots__ = ("file", "renamed_to", "changed", "ok", "output_path")
+
+def _jsonable(obj):
+    if isinstance(obj, LineRanges):
+        return list(obj)
+    if isinstance(obj, Mapping):
+        return dict(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+def report_to_json(rep: Mapping) -> str:
+    return json.dumps(rep, ensure_ascii=False, default=_jsonable)
+
+# Consumidores de informes de limpieza: reciben un informe cada vez (add) y no
+# guardan la lista, así la memoria no crece con el tamaño del corpus.
+
+def pretty_report_lines(rep: dict) -> list[str]:
+    lines = []
+    status = "OK" if rep["ok"] else "REVISAR"
+    renamed = f" → guardado como: {rep['renamed_to']}" if rep["renamed_to"] else ""
+    lines.append(f"Archivo: {rep['file']}  [{status}]{renamed}")
+    if rep.get("sanitized_lines"):
+        lines.append(f"  · Saneado de invisibles en líneas: {rep['sanitized_lines']}")
+    if rep.get("tabs_fixed_count"):
+        lines.append(f"  · Tabulación tras cabeceras corregida en {rep['tabs_fixed_count']} líneas: {rep['tabs_fixed_lines']}")
+    if rep.get("double_colon_detected_lines"):
+        if rep.get("double_colon_fixed_lines"):
+            lines.append(f"  · ':' duplicado tras cabecera corregido en: {rep['double_colon_fixed_lines']}")
+        else:
+            lines.append(f"  · ':' duplicado tras cabecera detectado en: {rep['double_colon_detected_lines']}")
+    if rep.get("dropped_initial_missing_header"):
+        info = rep["dropped_initial_missing_header"]
+        lines.append(f"  · Línea {info['line_number']} (primera del cuerpo) sin cabecera → BORRADA.")
+    if rep.get("initial_dep_removed"):
+        info = rep["initial_dep_removed"]
+        lines.append(f"  · Primera línea del cuerpo era '%{info['tier']}:' → BORRADA.")
+    if rep.get("merged_orphan_lines"):
+        pairs = ", ".join([f"L{x['line_number']}→L{x['into_line']}" for x in rep["merged_orphan_lines"]])
+        lines.append(f"  · Huérfanas fusionadas con la anterior *CODE:: {pairs}")
+    if rep.get("fixed_lines_prefix_com"):
+        lines.append(f"  · Líneas sin cabecera prefijadas como %com: {rep['fixed_lines_prefix_com']}")
+    if rep.get("dropped_lines"):
+        lines.append(f"  · Cabeceras vacías eliminadas en líneas: {rep['dropped_lines']}")
+    end_pre, end_post, end_final = rep["end_changes"]["pre"], rep["end_changes"]["post"], rep["end_changes"]["final"]
+    msgs = []
+    for tag, info in (("pre", end_pre), ("post", end_post), ("final", end_final)):
+        parts = []
+        if info.get("end_added"): parts.append("añadido")
+        if info.get("end_moved"): parts.append("recolocado")
+        if info.get("end_dups_removed"): parts.append(f"duplicados eliminados={info['end_dups_removed']}")
+        if parts:
+            msgs.append(f"{tag}: " + ", ".join(parts))
+    if msgs:
+        lines.append("  · @End → " + " | ".join(msgs))
+    if rep.get("errors"):
+        lines.append("  × Errores restantes:")
+        lines.extend([f"    - {e}" for e in rep["errors"]])
+    if rep.get("warnings"):
+        lines.append("  ⚠ Avisos:")
+        lines.extend([f"    - {w}" for w in rep["warnings"]])
+    return lines
+
+def pretty_report_text(rep: dict) -> str:
+    return "\n".join(pretty_report_lines(rep)) + "\n"
+
+class PrettyTextSink:
+    # El resumen legible de siempre, escrito informe a informe (por defecto a stdout).
+    def __init__(self, stream=None):
+        self.stream = stream if stream is not None else sys.stdout
+
+    def add(self, rep: dict):
+        self.stream.write(pretty_report_text(rep) + "\n")
+        self.stream.flush()
+
+    def close(self):
+        pass
+
+class JsonlReportSink:
+    # Un informe completo por línea (JSON Lines).
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+        self._f = open(self.path, "w", encoding="utf-8")
+
+    def add(self, rep: dict):
+        self._f.write(report_to_json(rep) + "\n")
+
+    def close(self):
+        self._f.close()
+
+class SummaryCounter:
+    # Sólo contadores: memoria constante aunque el corpus tenga cientos de miles de archivos.
+    def __init__(self):
+        self.counts = {
+            "files": 0, "ok": 0, "review": 0, "changed": 0, "renamed": 0,
+            "sanitized_lines": 0, "tabs_fixed_lines": 0, "double_colon_fixed_lines": 0,
+            "fixed_lines_prefix_com": 0, "dropped_lines": 0, "merged_orphan_lines": 0,
+            "errors": 0, "warnings": 0,
+        }
+
+    def add(self, rep: dict):
+        c = self.counts
+        c["files"] += 1
+        c["ok" if rep["ok"] else "review"] += 1
+        c["changed"] += bool(rep["changed"])
+        c["renamed"] += bool(rep["renamed_to"])
+        for key in ("sanitized_lines", "tabs_fixed_lines", "double_colon_fixed_lines", "fixed_lines_prefix_com",
+                    "dropped_lines", "merged_orphan_lines", "errors", "warnings"):
+            c[key] += len(rep.get(key) or ())
+
+    def close(self):
+        pass
+
+    def text(self) -> str:
+        c = self.counts
+        return (f"Archivos: {c['files']} · OK: {c['ok']} · Revisar: {c['review']} · Modificados: {c['changed']}"
+                f" · Errores: {c['errors']} · Avisos: {c['warnings']}")
+
+def feed_sinks(reports, sinks) -> None:
+    # Pasa cada informe a todos los consumidores según va llegando y los cierra al final.
+    try:
+        for rep in reports:
+            for sink in sinks:
+                sink.add(rep)
+    finally:
+        for sink in sinks:
+            sink.close()
@@ -1,4 +1,6 @@
-import re
+import codecs, hashlib, io, os, re, shutil, uuid
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor
 from pathlib import Path
 
 ID_RE       = re.compile(r'^@ID:\s*(.+)$', re.MULTILINE)
@@ -10,6 +12,10 @@ END_RE_LINE = re.compile(r'^\s*@End\s*$', re.MULTILINE)
 CTRL_EXCEPT_TAB_RE = re.compile(r'[\x00-\x08\x0B\x0C\x0E-\x1F\x7F]')
 ZEROWIDTH_RE       = re.compile(r'[\u200B-\u200D\uFEFF]')
 LEADING_JUNK_RE    = re.compile(r'^[ \x00-\x08\x0B\x0C\x0E-\x1F\u200B-\u200D\uFEFF]+')
+INVISIBLE_RE       = re.compile(r'[\x00-\x08\x0B\x0C\x0E-\x1F\x7F\u200B-\u200D\uFEFF]')
+# Tabla para str.translate: borra controles (salvo TAB) y anchos cero de una vez.
+INVISIBLE_TABLE    = dict.fromkeys([*range(0x00, 0x09), 0x0B, 0x0C, *range(0x0E, 0x20), 0x7F,
+                                    *range(0x200B, 0x200E), 0xFEFF])
 
 ALLOWED_DEP_TIER_NAMES = {"err","com","sit","mor","gra","act"}
 
@@ -28,20 +34,53 @@ def parse_id_codes(text: str) -> set[str]:
             codes.add(fields[2])
     return codes
 
+def parse_id_codes_from_lines(lines) -> set[str]:
+    # Equivalente a parse_id_codes("\n".join(lines)) sin unir el texto (vale cualquier
+    # iterable): con '@ID:' vacío, el '\s*' de ID_RE salta a la siguiente línea con contenido.
+    codes = set()
+    waiting = False
+    for ln in lines:
+        if waiting:
+            if not ln.strip():
+                continue
+            value, waiting = ln, False
+        elif ln.startswith("@ID:"):
+            value = ln[4:]
+            if not value.strip():
+                waiting = True
+                continue
+        else:
+            continue
+        fields = [x.strip() for x in value.split('|')]
+        if len(fields) >= 3 and fields[2]:
+            codes.add(fields[2])
+    return codes
+
 def count_header_occurrences(line: str) -> int:
     return len([m.group(0) for m in ANY_HDR_RE.finditer(line)])
 
+def sanitize_line(s: str) -> str:
+    # Quitados controles y anchos cero, lo único que LEADING_JUNK_RE puede
+    # encontrar al principio son espacios.
+    if INVISIBLE_RE.search(s):
+        s = s.translate(INVISIBLE_TABLE)
+    return s.lstrip(' ')
+
 def sanitize_controls(text: str):
     lines = text.splitlines()
     touched = []
-    for i, s in enumerate(lines):
-        original = s
-        s = ZEROWIDTH_RE.sub('', s)
-        s = ''.join(ch for ch in s if (ch == '\t' or not CTRL_EXCEPT_TAB_RE.match(ch)))
-        s = LEADING_JUNK_RE.sub('', s)
-        if s != original:
-            lines[i] = s
-            touched.append(i + 1)
+    if INVISIBLE_RE.search(text):
+        for i, s in enumerate(lines):
+            new = sanitize_line(s)
+            if new != s:
+                lines[i] = new
+                touched.append(i + 1)
+    else:
+        # Sin invisibles en todo el archivo sólo pueden cambiar las líneas con espacios iniciales
+        for i, s in enumerate(lines):
+            if s[:1] == ' ':
+                lines[i] = s.lstrip(' ')
+                touched.append(i + 1)
     return "\n".join(lines), touched
 
 def next_nonclobber_name(path: Path, suffix: str = ".fix") -> Path:
@@ -53,7 +92,178 @@ def next_nonclobber_name(path: Path, suffix: str = ".fix") -> Path:
         k += 1
     return newp
 
+def file_sha256(path: Path, bufsize: int = 1 << 20) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(bufsize):
+            h.update(chunk)
+    return h.hexdigest()
+
+def sniff_encoding(path: Path, bufsize: int = 1 << 20) -> tuple[str, str]:
+    # Se decide la codificación una vez, validando UTF-8 sobre los bytes (sin guardar
+    # el texto). Si no lo es, lo mismo que hacía read_text(errors="ignore").
+    dec = codecs.getincrementaldecoder("utf-8")()
+    try:
+        with open(path, "rb") as f:
+            while chunk := f.read(bufsize):
+                dec.decode(chunk)
+        dec.decode(b"", final=True)
+    except UnicodeDecodeError:
+        return io.text_encoding(None), "ignore"
+    return "utf-8", "strict"
+
+def read_text_sniffed(path: Path) -> str:
+    # Una sola lectura; mismo resultado que read_text("utf-8") con reintento errors="ignore"
+    raw = Path(path).read_bytes()
+    try:
+        text = raw.decode("utf-8")
+    except UnicodeDecodeError:
+        return io.TextIOWrapper(io.BytesIO(raw), encoding=io.text_encoding(None), errors="ignore").read()
+    return text.replace("\r\n", "\n").replace("\r", "\n")
+
+def iter_text_lines(path: Path, encoding: str, errors: str = "strict", hasher=None):
+    # Las líneas de read_text(...).splitlines(), leyendo el archivo poco a poco.
+    # hasher (opcional) recibe el texto tal como lo devolvería read_text.
+    with open(path, encoding=encoding, errors=errors) as f:
+        for chunk in f:
+            if hasher is not None:
+                hasher.update(chunk.encode("utf-8", "surrogatepass"))
+            yield from chunk.splitlines()
+
+def stage_lines(directory: Path, lines, encoding: str = "utf-8", batch: int = 4096) -> tuple[Path, bytes]:
+    # Como stage_text para "\n".join(lines) + "\n" sin construir el texto; devuelve
+    # también el sha256 de ese texto para saber si cambió.
+    tmp = Path(directory) / f".{uuid.uuid4().hex}.tmp"
+    h = hashlib.sha256()
+    buf = []
+    try:
+        with open(tmp, "x", encoding=encoding) as f:
+            for ln in lines:
+                buf.append(ln)
+                if len(buf) >= batch:
+                    chunk = "\n".join(buf) + "\n"; buf.clear()
+                    h.update(chunk.encode("utf-8", "surrogatepass")); f.write(chunk)
+            if buf:
+                chunk = "\n".join(buf) + "\n"
+                h.update(chunk.encode("utf-8", "surrogatepass")); f.write(chunk)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+    return tmp, h.digest()
+
+def stage_text(directory: Path, text: str, encoding: str = "utf-8") -> Path:
+    # Temporal oculto (no es *.cha) en la carpeta de destino, listo para os.replace.
+    # open(..., "x") en vez de mkstemp para que los permisos sigan la umask.
+    tmp = Path(directory) / f".{uuid.uuid4().hex}.tmp"
+    try:
+        with open(tmp, "x", encoding=encoding) as f:
+            f.write(text)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+    return tmp
+
+def write_text_atomic(path: Path, text: str, encoding: str = "utf-8") -> None:
+    # Se escribe a un temporal en la misma carpeta y se renombra: nunca queda a medias.
+    path = Path(path)
+    tmp = stage_text(path.parent, text, encoding=encoding)
+    try:
+        os.replace(tmp, path)
+    finally:
+        tmp.unlink(missing_ok=True)
+
+def write_bytes_atomic(path: Path, data: bytes) -> None:
+    # Igual que write_text_atomic, para binarios
+    path = Path(path)
+    tmp = path.parent / f".{uuid.uuid4().hex}.tmp"
+    try:
+        with open(tmp, "xb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    finally:
+        tmp.unlink(missing_ok=True)
+
+def backup_file(path: Path, bak: Path) -> None:
+    # Enlace duro (sin copiar datos) si el sistema de archivos lo admite; si no, copia.
+    # Sólo es seguro si después el original se sustituye con os.replace, no in situ.
+    bak.unlink(missing_ok=True)
+    try:
+        os.link(path, bak)
+    except OSError:
+        shutil.copy2(path, bak)
+
+def free_name(taken: set[str], stem: str, ext: str) -> str:
+    # Como next_nonclobber_name pero contra un índice en memoria (nombres con os.path.normcase)
+    name = f"{stem}{ext}"
+    k = 1
+    while os.path.normcase(name) in taken:
+        name = f"{stem}.{k}{ext}"
+        k += 1
+    return name
+
+def dir_names(directory: Path) -> set[str]:
+    with os.scandir(directory) as it:
+        return {os.path.normcase(e.name) for e in it}
+
 def dir_has_cha(input_dir) -> dict:
     p = Path(input_dir)
     chas = sorted(p.rglob("*.cha"))
     return {"ok": len(chas) > 0, "count": len(chas), "examples": [str(x) for x in chas[:10]], "root": str(p.resolve())}
+
+def resolve_workers(workers: int | None) -> int:
+    # None/0 (o negativo) → todos los núcleos
+    if not workers or workers < 0:
+        return os.cpu_count() or 1
+    return workers
+
+def _apply_all(fn, batch: list) -> list:
+    return [fn(x) for x in batch]
+
+def map_ordered(fn, items, workers: int | None = 1, chunksize: int | None = None, executor: Executor | None = None,
+                discard=None):
+    # Aplica fn en un pool de procesos; los resultados salen en el orden de entrada.
+    # Se envían lotes de chunksize y nunca hay más de dos por proceso en vuelo, así que
+    # la memoria no crece con el número de elementos aunque el consumidor sea lento.
+    # executor: un pool ya abierto (de workers procesos) que se reutiliza y no se cierra.
+    # discard: si el consumidor para antes de tiempo (close, break, excepción), recibe
+    # cada resultado ya calculado que no llegó a salir (p. ej. para borrar temporales).
+    items = list(items)
+    workers = min(resolve_workers(workers), len(items))
+    if workers <= 1 and executor is None:
+        yield from map(fn, items)
+        return
+    if chunksize is None:
+        chunksize = max(1, min(len(items) // (max(workers, 1) * 8), 32))
+    if executor is not None:
+        yield from _map_window(executor, fn, items, max(workers, 1), chunksize, discard)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as ex:
+        yield from _map_window(ex, fn, items, workers, chunksize, discard)
+
+def _map_window(ex: Executor, fn, items: list, workers: int, chunksize: int, discard=None):
+    pending = deque(); batch = iter(())
+    try:
+        for i in range(0, len(items), chunksize):
+            pending.append(ex.submit(_apply_all, fn, items[i:i + chunksize]))
+            if len(pending) >= workers * 2:
+                batch = iter(pending.popleft().result())
+                yield from batch
+        while pending:
+            batch = iter(pending.popleft().result())
+            yield from batch
+    finally:
+        for fut in pending:
+            fut.cancel()
+        if discard is not None:
+            # lo que queda del lote en curso y los lotes que ya no se podían cancelar
+            for result in batch:
+                discard(result)
+            for fut in pending:
+                if fut.cancelled():
+                    continue
+                try:
+                    done = fut.result()
+                except Exception:
+                    continue
+                for result in done:
+                    discard(result)